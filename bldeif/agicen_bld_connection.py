@@ -1,13 +1,20 @@
 
 import sys,os
 import re
+import json
 import time
+import calendar
+import threading
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import bldeif.utils.ac_prefixes  as utils
 
 from bldeif.utils.eif_exception import ConfigurationError, OperationalError
 from bldeif.connection import BLDConnection
 from bldeif.utils.time_helper import TimeHelper
+from bldeif.utils.cache_file  import CacheFile
+import bldeif.utils.wsapi_query as wsapi_query
 
 from pyral import Rally, rallySettings, RallyRESTAPIError
 
@@ -23,6 +30,11 @@ ISO8601_TS_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
 EXTENSION_SPEC_PATTERN = re.compile(r'^(?P<ext_class>[\w\.]+)\s*\((?P<ext_parm>[^\)]+)\)$')
 
+ARTIFACT_CACHE_SIZE = 10000  # max number of FormattedID -> Artifact ref entries kept
+ARTIFACT_MEMORY_TTL = 600    # secs a FormattedID -> Artifact ref entry is good for when ArtifactCacheTTL isn't set
+
+BATCH_CREATE_FETCH = "ObjectID,Number,Status,Start,Duration,Uri,BuildDefinition,Name"
+
 ############################################################################################
 
 class MockBuild(object):
@@ -43,6 +55,18 @@ class AgileCentralConnection(BLDConnection):
         self.password_required = True
         self.build_def = {}  # key by Project, then value is in turn a dict keyed by Job name with number and date
                              # of last Build
+        self.recent_build_keys   = set()  # (BuildDefinition ObjectID, Number) of the Builds seen by getRecentBuilds
+        self.recent_builds_since = None   # epoch seconds from which getRecentBuilds saw every Build
+        self._project_oids = {}  # project name keyed by ObjectID for the projects located by validateProjects
+        self.build_def_cache = None
+        self.build_def_fingerprint = None
+        self.prefix_cache = None
+        self.fid_pattern  = None  # compiled on first use from the FormattedID prefixes of the workspace
+        self.artifact_refs  = OrderedDict()  # FormattedID : (ObjectID, ref, when resolved) in least recently used order
+        self.artifact_lock  = threading.Lock()
+        self.artifact_cache = None
+        self.repository_locks = {}  # Builds are created concurrently, the VCS items of an SCMRepository one at a time
+        self.repository_locks_lock = threading.Lock()
 
     def name(self):
         return "AgileCentral"
@@ -77,6 +101,12 @@ class AgileCentralConnection(BLDConnection):
         self.project_name    = config.get("Project",   None)  # This gets bled in by the BLDConnector
         self.restapi_debug   = config.get("Debug", False)
         self.restapi_logger  = self.log
+        self.concurrency     = max(1, int(config.get("Concurrency", 4)))  # number of BuildDefinitions whose Builds are created at once
+        self.batch_size      = int(config.get("BatchSize", 0))  # Builds per WSAPI batch request, 0 or 1 creates them one at a time
+        self.prefix_cache_ttl = int(config.get("PrefixCacheTTL", 0)) * 60  # in minutes in the config, 0 means no caching
+        self.artifact_cache_ttl = int(config.get("ArtifactCacheTTL", 0)) * 60  # in minutes in the config, 0 means not persisted
+        self.connect_timeout = float(config.get("ConnectTimeout", 10))   # seconds, for the requests not issued through pyral
+        self.read_timeout    = float(config.get("ReadTimeout",    120))
 
         self.proxy = None
         if self.proxy_server:
@@ -84,7 +114,7 @@ class AgileCentralConnection(BLDConnection):
             if self.proxy_username and self.proxy_password:
                 self.proxy  = "%s://%s:%s@%s:%s" % (self.proxy_protocol, self.proxy_username, self.proxy_password, self.proxy_server, self.proxy_port)
 
-        valid_config_items = ['Server', 'Port', 'APIKey','Workspace','Project','Username','Password','ProxyProtocol', 'ProxyServer','ProxyPort','ProxyUser','ProxyUsername', 'ProxyPassword','Debug', 'Lookback']
+        valid_config_items = ['Server', 'Port', 'APIKey','Workspace','Project','Username','Password','ProxyProtocol', 'ProxyServer','ProxyPort','ProxyUser','ProxyUsername', 'ProxyPassword','Debug', 'Lookback', 'Concurrency', 'BatchSize', 'PrefixCacheTTL', 'ArtifactCacheTTL', 'ConnectTimeout', 'ReadTimeout']
         invalid_config_items = [item for item in config.keys() if item not in valid_config_items]
         if invalid_config_items:
             problem = "AgileCentral section of the config contained these invalid entries: %s" % ", ".join(invalid_config_items)
@@ -124,14 +154,18 @@ class AgileCentralConnection(BLDConnection):
             non_mep_projects = list(set([project for project in target_projects if ' // ' not in project]))
         except Exception as msg:
             raise OperationalError("%s %s" % ("error in agicen_bld_connection.py for getting non_mep_projects", msg))
-        query = self._construct_ored_Name_query(non_mep_projects)
-        response = self.agicen.get('Project', fetch='Name,ObjectID', query=query, workspace=self.workspace_name,
-                                   project=None, projectScopeDown=True, pagesize=200)
-        if response.errors or response.resultCount == 0:
-            raise ConfigurationError(
-                'Unable to locate a Project with the name: %s in the target Workspace: %s' % (self.project_name, self.workspace_name))
+        found_projects = []
+        if non_mep_projects:
+            try:
+                found_projects = self._getByValues('Project', 'Name', non_mep_projects, fetch='Name,ObjectID',
+                                                   workspace=self.workspace_name, project=None,
+                                                   projectScopeDown=True, pagesize=200)
+            except OperationalError:
+                found_projects = []
+            if not found_projects:
+                raise ConfigurationError(
+                    'Unable to locate a Project with the name: %s in the target Workspace: %s' % (self.project_name, self.workspace_name))
 
-        found_projects = [project for project in response]
         try:
             found_project_names = list(set([p.Name for p in found_projects]))
         except Exception as msg:
@@ -147,28 +181,40 @@ class AgileCentralConnection(BLDConnection):
             return False
 
         #deal with the mep_projects
+        mep_found = {}
         for mep in mep_projects:
             proj = self.agicen.getProject(mep)
             if proj:
                 found_projects.append(proj)
+                mep_found[mep] = proj
 
         self._project_cache = {proj.Name : proj.ref for proj in found_projects}
+        # the MEP projects are known to the rest of the connector by their path, getProject gives
+        # their ObjectID as a string while query results have it as an int
+        self._project_oids = {int(proj.ObjectID) : proj.Name for proj in found_projects}
+        self._project_oids.update({int(proj.ObjectID) : mep for mep, proj in mep_found.items()})
         return True
 
 
     def _construct_ored_Name_query(self, target_projects):
         if not target_projects: return ''
-        initial = '(Name = "%s")' % target_projects[0]
-        or_string = initial
-        for project in target_projects[1:]:
-            or_string = '(%s OR (Name = "%s"))' % (or_string, project)
-        return or_string
+        return wsapi_query.orQuery('Name', target_projects)
 
         #return "(%s)" % or_string[1:-1]
 
     def setSourceIdentification(self, other_name, other_version):
         self.other_name = other_name
         self.integration_other_version  = other_version
+        self._refreshIntegrationHeaders()
+
+    def _refreshIntegrationHeaders(self):
+        """
+            When connecting didn't wait for the other system's version, the headers of the connection are brought up to date
+        """
+        if getattr(self, 'agicen', None):
+            custom_headers = self.get_custom_headers()
+            self.agicen.session.headers['X-RallyIntegrationName']    = custom_headers['name']
+            self.agicen.session.headers['X-RallyIntegrationVersion'] = custom_headers['version']
 
     def get_custom_headers(self):
         custom_headers =  {}
@@ -274,6 +320,7 @@ class AgileCentralConnection(BLDConnection):
         self.integration_version = header_info['version']
         if 'other_version' in header_info:
             self.integration_other_version = header_info['other_version']
+            self._refreshIntegrationHeaders()
 
 
     def getRecentBuilds(self, struct_ref_time, projects):
@@ -291,11 +338,24 @@ class AgileCentralConnection(BLDConnection):
         log_msg = '   recent Builds query: %s' %  ' and '.join(selectors)
         self.log.info(log_msg)
         builds = {}
+        self.recent_build_keys = set()
+
+        project_names = self._projectNamesByOID(projects)
+        if project_names:
+            # workspace wide queries for the Builds of all the projects (a single one unless there are
+            # a great many projects), sorted out by project here
+            project_builds = dict((project, []) for project in projects)
+            for query in wsapi_query.orQueries('Project.ObjectID', project_names.keys(), selectors[0], quoted=False):
+                for build in self._retrieveBuilds(None, query):
+                    project_builds[project_names[int(build.Project.ObjectID)]].append(build)
+            project_responses = [(project, project_builds[project]) for project in projects]
+        else:
+            project_responses = ((project, self._retrieveBuilds(project, selectors)) for project in projects)
 
-        for project in projects:
-            response = self._retrieveBuilds(project, selectors)
+        for project, response in project_responses:
+            response = list(response)
             log_msg = "  %d recently added Agile Central Builds detected for project: %s"
-            self.log.info(log_msg % (response.resultCount, project))
+            self.log.info(log_msg % (len(response), project))
 
             for build in response:
                 build_name = build.BuildDefinition.Name
@@ -304,9 +364,29 @@ class AgileCentralConnection(BLDConnection):
                 if build_name not in builds[project]:
                     builds[project][build_name] = []
                 builds[project][build_name].append(build)
+                key = self.buildKey(build.BuildDefinition, build.Number)
+                if key:
+                    self.recent_build_keys.add(key)
+                else:
+                    self.log.debug("Build %s of %s has a non-numeric Number, ignoring it" % (build.Number, build_name))
+        self.recent_builds_since = calendar.timegm(struct_ref_time)
         return builds
 
 
+    def _projectNamesByOID(self, projects):
+        """
+            Return a dict of the project name (as given in projects) keyed by ObjectID for each of the projects,
+            or None unless all of the projects were located by validateProjects.
+        """
+        project_names = {}
+        for oid, name in self._project_oids.items():
+            if name in projects:
+                project_names[oid] = name
+        if set(project_names.values()) != set(projects):
+            return None
+        return project_names
+
+
     def _retrieveBuilds(self, project, selectors):
         fetch_fields = "ObjectID,CreationDate,Number,Start,Status,Duration,BuildDefinition,Name," +\
                        "Workspace,Project,Uri,Message,Changesets"
@@ -347,6 +427,67 @@ class AgileCentralConnection(BLDConnection):
     #         return response.next()
     #     return None
 
+    def useBuildDefinitionCache(self, filename, fingerprint):
+        """
+            Have the BuildDefinitions of the target projects persisted in filename between runs.
+            The fingerprint (eg, derived from the config file modification time) is recorded along with
+            them, BuildDefinitions cached with a different fingerprint are not used.
+        """
+        self.build_def_cache = CacheFile(filename, self.log)
+        self.build_def_fingerprint = "%s|%s" % (fingerprint, self.workspace_name)
+
+    def warmBuildDefinitionCache(self, projects):
+        """
+            Populate self.build_def for all of the projects at once, so that ensureBuildDefinitionExists
+            need not query for BuildDefinitions project by project.
+            The BuildDefinitions persisted by an earlier run are used when the count and the most recent
+            LastUpdateDate of the BuildDefinitions in the projects are still what they were then, which
+            takes a single one item query to determine.  Otherwise they are all retrieved in a single query.
+        """
+        project_names = self._projectNamesByOID(projects)
+        if not project_names:
+            return
+        criteria = 'Name != "Default Build Definition"'
+
+        count, latest = 0, []
+        for query in wsapi_query.orQueries('Project.ObjectID', project_names.keys(), criteria, quoted=False):
+            response = self.agicen.get('BuildDefinition', fetch='ObjectID,LastUpdateDate', query=query,
+                                       workspace=self.workspace_name, project=None,
+                                       order='LastUpdateDate desc', pagesize=1, limit=1)
+            if response.errors:
+                raise OperationalError(str(response.errors))
+            count  += response.resultCount
+            latest  = sorted(latest + [build_defn.LastUpdateDate for build_defn in response][:1])[-1:]
+        stamp = [count] + latest
+
+        cached = self.build_def_cache.read(self.build_def_fingerprint) if self.build_def_cache else None
+        if cached and cached['stamp'] == stamp:
+            self.log.debug("Using the %d cached BuildDefinitions" % count)
+            definitions = cached['definitions']
+        else:
+            definitions = dict((project, {}) for project in projects)
+            response = self._getByValues('BuildDefinition', 'Project.ObjectID', project_names.keys(), criteria,
+                                         quoted=False, fetch='ObjectID,Name,Project,Uri',
+                                         workspace=self.workspace_name, project=None,
+                                         order='Project.Name,Name', pagesize=1000)
+            for build_defn in response:
+                project = project_names[int(build_defn.Project.ObjectID)]
+                definitions[project][build_defn.Name] = {'ObjectID': build_defn.ObjectID, 'ref': build_defn.ref}
+            if self.build_def_cache:
+                try:
+                    self.build_def_cache.write({'stamp': stamp, 'definitions': definitions}, self.build_def_fingerprint)
+                except Exception as msg:
+                    self.log.warning("Unable to write BuildDefinition cache file %s: %s" % (self.build_def_cache.filename, msg))
+
+        for project in projects:
+            self.build_def[project] = {}
+            for plan_name, build_defn in definitions.get(project, {}).items():
+                self.build_def[project][plan_name] = MockBuild({'Name'     : plan_name,
+                                                                'ObjectID' : build_defn['ObjectID'],
+                                                                'oid'      : build_defn['ObjectID'],
+                                                                'ref'      : build_defn['ref']})
+
+
     def _fillBuildDefinitionCache(self, project):
         response = self.agicen.get('BuildDefinition',
                                   fetch='ObjectID,Name,Project,LastBuild,Uri', 
@@ -384,56 +525,58 @@ class AgileCentralConnection(BLDConnection):
              These will be a  pyral entity for each or a list of pyral entities in the case of Changesets
         """
         changesets = None
-        # if target_build.changeSets:
-        #     ac_changesets, missing_changesets = self.getCorrespondingChangesets(target_build)
-        #     # check for ac_changesets, if present take the SCMRepository of the first in the list (very arbitrary!)
-        #     if ac_changesets:
-        #         first_changeset = list(ac_changesets)[0]
-        #         criteria = 'Name = "%s"' % first_changeset.SCMRepository.Name
-        #         scm_repo = self.agicen.get('SCMRepository', fetch="Name", query=criteria, instance=True)
-        #     else:
-        #         scm_repo = self.ensureSCMRepositoryExists(target_build.repository, target_build.vcs)
-        #
-        #     changesets = self.ensureChangesetsExist(scm_repo, project, ac_changesets, missing_changesets)
+        # target_build.changeSets is only populated when VCS data is to be reflected (ShowVCSData),
+        # changes that can't be attributed to a repository are left out
+        if getattr(target_build, 'changeSets', None) and getattr(target_build, 'repository', None):
+            # two plans building the same commit must not both create its SCMRepository or Changeset
+            with self.repositoryLock(target_build.repository):
+                ac_changesets, missing_changesets = self.getCorrespondingChangesets(target_build)
+                # check for ac_changesets, if present take the SCMRepository of the first in the list (very arbitrary!)
+                if ac_changesets:
+                    first_changeset = list(ac_changesets)[0]
+                    scm_repo = first_changeset.SCMRepository
+                else:
+                    scm_repo = self.ensureSCMRepositoryExists(target_build.repository, target_build.vcs)
+
+                changesets = self.ensureChangesetsExist(scm_repo, project, ac_changesets, missing_changesets)
 
         #build_defn = self.ensureBuildDefinitionExists(job.fully_qualified_path(), project, target_build.vcs)
         build_defn = self.ensureBuildDefinitionExists(plan, project)
         return changesets, build_defn
 
 
+    def repositoryLock(self, repo_name):
+        """
+            Return the lock serializing the lookup and creation of the SCMRepository named repo_name and of
+            its Changesets, builds of other repositories have locks of their own and aren't held up.
+        """
+        key = (repo_name or '').replace('\\', '/').lower()
+        with self.repository_locks_lock:
+            return self.repository_locks.setdefault(key, threading.Lock())
+
+
     def getCorrespondingChangesets(self, build) :
+        """
+            Return a two-tuple of the Agile Central Changesets for the build's changeSets (present)
+            and the build's changeSets lacking one (missing).  The SCMRepository of the first
+            changeSet found is taken to be the build's, only Changesets in that SCMRepository count as present.
+        """
         build_changesets = build.changeSets
         if not build_changesets:
             return [], []
-        ids = [cs.commitId for cs in build_changesets]
-        scm_repository_name = ''
-        for id in ids:
-            criteria = '(Revision = "{0}")'.format(id)
-            response = self.agicen.get('Changeset', fetch="ObjectID,Revision,SCMRepository,Name", query=criteria)
-            if response.resultCount:
-                hits = [item for item in response]
-                scm_repository_name = hits[0].SCMRepository.Name
-                break
-
-        if scm_repository_name:
-            fields = "ObjectID,Revision,SCMRepository,Name"
-            query = "(SCMRepository.Name = {})".format(scm_repository_name)
-
-            response = self.agicen.get('Changeset', fetch=fields, query=query, order="CreationDate", pagesize=200)
-            if response.resultCount:
-                changesets = [item for item in response]
-
-            build_changesets_revisions = [bc.commitId for bc in build_changesets]
-            ac_changesets_revisions    = [cs.Revision for cs in changesets]
-
-            try:
-                missing = [bc for bc in build_changesets if bc.commitId not in ac_changesets_revisions]
-            except Exception as msg:
-                raise OperationalError("%s %s" % ("error in agicen_bld_connection.py for getting missing", msg))
-            try:
-                present = [cs for cs in changesets if cs.Revision in build_changesets_revisions]
-            except Exception as msg:
-                raise OperationalError("%s %s" % ("error in agicen_bld_connection.py for getting present", msg))
+        found = self.resolveChangesets([cs.commitId for cs in build_changesets])
+
+        first_found = [found[cs.commitId] for cs in build_changesets if cs.commitId in found][:1]
+        if first_found:
+            scm_repository_name = first_found[0].SCMRepository.Name
+            present, missing = [], []
+            for bc in build_changesets:
+                changeset = found.get(bc.commitId)
+                if changeset and changeset.SCMRepository.Name == scm_repository_name:
+                    if changeset not in present:
+                        present.append(changeset)
+                else:
+                    missing.append(bc)
             return present, missing
         else:
             vcs_type = build_changesets[0].vcs
@@ -441,6 +584,19 @@ class AgileCentralConnection(BLDConnection):
             return [], build_changesets
 
 
+    def resolveChangesets(self, revisions):
+        """
+            Return a dict keyed by revision of the Changesets having one of the revisions,
+            looked up a chunk of revisions per query.
+        """
+        changesets = {}
+        response = self._getByValues('Changeset', 'Revision', revisions, fetch="ObjectID,Revision,SCMRepository,Name",
+                                     workspace=self.workspace_name, project=None, pagesize=200)
+        for changeset in response:
+            changesets.setdefault(changeset.Revision, changeset)
+        return changesets
+
+
     def ensureSCMRepositoryExists(self, repo_name, vcs_type):
         """
             Use the WSAPI case-insensitive Name contains ... syntax so that we can "match" a name like 'wombat' to 'Wombat'
@@ -478,7 +634,7 @@ class AgileCentralConnection(BLDConnection):
                 'CommitTimestamp' : datetime.utcfromtimestamp(mc.timestamp / 1000).strftime('%Y-%m-%dT%H:%M:%SZ'),
                 'Message'         : mc.message,
                 'Uri'             : mc.uri,
-                'Artifacts'       : valid_artifacts
+                'Artifacts'       : [artifact.ref for artifact in valid_artifacts]
             }
             try:
                 changeset = self.agicen.create('Changeset', changeset_payload)
@@ -491,11 +647,40 @@ class AgileCentralConnection(BLDConnection):
         return ac_changesets
 
     def parseForArtifacts(self, commit_message):
-        prefixes = [prefix for item in utils.get_all_prefixes(self.agicen) for prefix in item.values()]
-        fid_pattern = r'((%s)\d+)' % '|'.join(prefixes)
-        result = re.findall(fid_pattern, commit_message, re.IGNORECASE)
+        result = self.artifactPattern().findall(commit_message)
         return [item[0].upper() for item in result]
 
+    def artifactPattern(self):
+        """
+            Return the compiled pattern matching the FormattedID of any artifact in the workspace,
+            the artifact type prefixes are resolved once per connection (or per PrefixCacheTTL if set).
+        """
+        if self.fid_pattern is None:
+            prefixes = self._artifactPrefixes()
+            self.fid_pattern = re.compile(r'((%s)\d+)' % '|'.join(prefixes), re.IGNORECASE)
+        return self.fid_pattern
+
+    def usePrefixCache(self, filename, fingerprint):
+        """
+            Have the artifact type prefixes persisted in filename for PrefixCacheTTL minutes.
+        """
+        if self.prefix_cache_ttl > 0:
+            self.prefix_cache = CacheFile(filename, self.log, ttl=self.prefix_cache_ttl)
+            self.prefix_fingerprint = "%s|%s" % (fingerprint, self.workspace_name)
+
+    def _artifactPrefixes(self):
+        if self.prefix_cache:
+            prefixes = self.prefix_cache.read(self.prefix_fingerprint)
+            if prefixes:
+                return prefixes
+        prefixes = [prefix for item in utils.get_all_prefixes(self.agicen) for prefix in item.values()]
+        if self.prefix_cache:
+            try:
+                self.prefix_cache.write(prefixes, self.prefix_fingerprint)
+            except Exception as msg:
+                self.log.warning("Unable to write prefix cache file %s: %s" % (self.prefix_cache.filename, msg))
+        return prefixes
+
 
     def validatedArtifacts(self, commit_fid):
         # commit_fid is a dict
@@ -505,33 +690,107 @@ class AgileCentralConnection(BLDConnection):
         except Exception as msg:
             self.log.error("Cannot get a list of formatted ids of artifacts in the commit messages, in validatedArtfacts")
             raise OperationalError(msg)
-        query = self.makeOrQuery("FormattedID", fids)
-        response = self.agicen.get('Artifact', fetch="FormattedID,ObjectID", query=query, project=None, pagesize=200, start=1)
-        found_arts = [art for art in response]
+        found_arts = self.resolveArtifacts(fids)
         va = {}
         for ident in commit_fid.keys():
-            va[ident] = []
-            matches = [found_art for found_art in found_arts if found_art.FormattedID in commit_fid[ident]]
-            if matches:
-                va[ident] = matches
-                # for art in matches:
-                #     if art.Project.oid != targeted_project.oid:
-                #         self.log.warning('')
+            mentioned = OrderedDict.fromkeys(commit_fid[ident])  # a FormattedID may be mentioned more than once
+            va[ident] = [found_arts[fid] for fid in mentioned if fid in found_arts]
         return va
 
-    def makeOrQuery(self,field, values):
-        if not values:
-            return None
 
-        values = list(values)
-        query = '(%s = "%s")' %(field, values[0])
-        if len(values) == 1:
-            return query
-        else:
-            values.pop(0)
-            for v in values:
-                query = '(%s OR (%s = "%s"))' % (query, field, v)
-            return query
+    def resolveArtifacts(self, fids):
+        """
+            Return a dict keyed by FormattedID holding a MockBuild with the FormattedID, ObjectID and ref
+            of the Artifact for each of the fids that identifies an existing Artifact.
+            FormattedIDs resolved less than ArtifactCacheTTL ago (in this run or a recent one), or ARTIFACT_MEMORY_TTL ago
+            (in this run) when it isn't set, are taken from the cache.  The others are looked up a chunk at a time
+            with up to Concurrency queries in flight.
+        """
+        found_arts = {}
+        unknown = []
+        expiry = time.time() - (self.artifact_cache_ttl or ARTIFACT_MEMORY_TTL)
+        with self.artifact_lock:
+            self._loadArtifactCache()
+            for fid in set(fids):
+                entry = self.artifact_refs.get(fid)
+                if entry and entry[2] >= expiry:
+                    self.artifact_refs.move_to_end(fid)
+                    oid, ref, resolved = entry
+                    found_arts[fid] = MockBuild({'FormattedID': fid, 'ObjectID': oid, 'oid': oid, 'ref': ref})
+                else:
+                    self.artifact_refs.pop(fid, None)  # an expired entry is dropped, the Artifact may be gone
+                    unknown.append(fid)
+        if not unknown:
+            return found_arts
+
+        chunks = wsapi_query.chunkValues('FormattedID', unknown)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(chunks))) as pool:
+            for artifacts in pool.map(self._lookupArtifacts, chunks):
+                for art in artifacts:
+                    found_arts[art.FormattedID] = MockBuild({'FormattedID': art.FormattedID, 'ObjectID': art.ObjectID,
+                                                             'oid': art.ObjectID, 'ref': art.ref})
+
+        now = int(time.time())
+        with self.artifact_lock:
+            for fid in unknown:
+                if fid in found_arts:
+                    self.artifact_refs[fid] = (found_arts[fid].ObjectID, found_arts[fid].ref, now)
+            while len(self.artifact_refs) > ARTIFACT_CACHE_SIZE:
+                self.artifact_refs.popitem(last=False)
+            self._saveArtifactCache()
+        return found_arts
+
+
+    def _lookupArtifacts(self, fids):
+        return self._getByValues('Artifact', 'FormattedID', fids, fetch="FormattedID,ObjectID",
+                                 project=None, pagesize=200, start=1)
+
+
+    def useArtifactCache(self, filename, fingerprint):
+        """
+            Have the FormattedID to Artifact ref lookups persisted in filename, each entry
+            is disregarded once it is more than ArtifactCacheTTL minutes old.
+        """
+        if self.artifact_cache_ttl > 0:
+            self.artifact_cache = CacheFile(filename, self.log)
+            self.artifact_fingerprint = "%s|%s" % (fingerprint, self.workspace_name)
+            self.artifact_cache_loaded = False
+
+    def _loadArtifactCache(self):
+        if not self.artifact_cache or self.artifact_cache_loaded:
+            return
+        self.artifact_cache_loaded = True
+        entries = self.artifact_cache.read(self.artifact_fingerprint) or []
+        expiry = time.time() - self.artifact_cache_ttl
+        for fid, oid, ref, resolved in entries:  # in least recently used order
+            if resolved >= expiry and fid not in self.artifact_refs:
+                self.artifact_refs[fid] = (oid, ref, resolved)
+
+    def _saveArtifactCache(self):
+        if not self.artifact_cache:
+            return
+        entries = [[fid, oid, ref, resolved] for fid, (oid, ref, resolved) in self.artifact_refs.items()]
+        try:
+            self.artifact_cache.write(entries, self.artifact_fingerprint)
+        except Exception as msg:
+            self.log.warning("Unable to write artifact cache file %s: %s" % (self.artifact_cache.filename, msg))
+
+    def makeOrQuery(self,field, values, quoted=True):
+        return wsapi_query.orQuery(field, values, quoted)
+
+    def _getByValues(self, entity, field, values, criteria=None, quoted=True, **kwargs):
+        """
+            Obtain the entity items whose field has any one of the values (and which satisfy the criteria
+            if given), issuing as many queries as it takes to keep each within bounds.
+            The kwargs are passed along to pyral's get, the items of all the responses are returned in a list.
+        """
+        items = []
+        for query in wsapi_query.orQueries(field, values, criteria, quoted):
+            response = self.agicen.get(entity, query=query, **kwargs)
+            if response.errors:
+                raise OperationalError(str(response.errors))
+            items.extend(response)
+        return items
 
     #def ensureBuildDefinitionExists(self, job_path, project, job_uri):
 
@@ -609,6 +868,126 @@ class AgileCentralConnection(BLDConnection):
         return int_work_item
 
 
+    def _createInternalBatch(self, int_work_items):
+        """
+            When BatchSize is configured, create the Builds BatchSize at a time with the WSAPI batch endpoint,
+            which performs the creates in the order given.  Builds the batch failed to create
+            (or all of those in a batch that WSAPI rejected as a whole) are then created one at a time,
+            so that a single offending Build doesn't keep the rest from being created.
+            A batch whose outcome is unknown (eg, the response timed out) may well have been carried out,
+            so only the Builds Agile Central turns out not to have are created one at a time.
+        """
+        if self.batch_size < 2:
+            return super()._createInternalBatch(int_work_items)
+
+        builds = []
+        for ix in range(0, len(int_work_items), self.batch_size):
+            chunk = int_work_items[ix : ix + self.batch_size]
+            try:
+                outcomes = self._batchCreate('Build', chunk)
+            except Exception as msg:
+                self.log.warning("Batch create of %d Builds failed, checking which of them were created: %s" % (len(chunk), msg))
+                try:
+                    outcomes = self._createdBuilds(chunk)
+                except Exception as exc:
+                    # the next run finds out which of them are missing and creates those
+                    self.log.error("Unable to determine which of the %d Builds of the failed batch were created, " \
+                                   "leaving them be: %s" % (len(chunk), exc))
+                    builds.extend([exc] * len(chunk))
+                    continue
+
+            for int_work_item, outcome in zip(chunk, outcomes):
+                if outcome is not None and not isinstance(outcome, str):
+                    self.log.debug("  Created Build: %-20.20s #%5s  %-8.8s %s" % (outcome.BuildDefinition.Name, outcome.Number, outcome.Status, outcome.Start))
+                    builds.append(outcome)
+                    continue
+                if outcome:
+                    self.log.debug("Batch create of Build #%s failed, retrying it alone: %s" % (int_work_item['Number'], outcome))
+                try:
+                    builds.append(self._createInternal(int_work_item))
+                except Exception as exc:
+                    builds.append(exc)
+        return builds
+
+
+    def _batchCreate(self, entity, int_work_items):
+        """
+            Issue a single request to the WSAPI batch endpoint to create an entity item for each of
+            the int_work_items.  Returns a list parallel to int_work_items holding, for each, a MockBuild
+            with the attributes of the created item or the error message WSAPI reported for it.
+            A request refused outright (a 4xx status) created nothing, the message is then reported for every item.
+            An exception is raised when it can't be told what the request did.
+        """
+        resource = 'batch'
+        auth_token = self.agicen.obtainSecurityToken()  # only needed when not using an API key
+        if auth_token:
+            resource = 'batch?key=%s' % auth_token
+        path = '/%s/create?fetch=%s' % (entity.lower(), BATCH_CREATE_FETCH)
+        entries = [{'Entry': {'Path': path, 'Method': 'PUT', 'Body': {entity: item}}} for item in int_work_items]
+
+        response = self.agicen.session.post('%s/%s' % (self.agicen.service_url, resource), data=json.dumps({'Batch': entries}),
+                                            timeout=(self.connect_timeout, self.read_timeout))
+        if 400 <= response.status_code < 500:
+            return ["WSAPI batch request rejected with status code %s" % response.status_code] * len(int_work_items)
+        if response.status_code != 200:
+            raise OperationalError("WSAPI batch request failed with status code %s" % response.status_code)
+        batch_result = response.json()['BatchResult']
+        if batch_result.get('Errors'):
+            raise OperationalError(batch_result['Errors'][0])
+        results = batch_result['Results']
+        if len(results) != len(int_work_items):
+            raise OperationalError("WSAPI batch response has %d results for %d entries" % (len(results), len(int_work_items)))
+
+        outcomes = []
+        for result in results:
+            result = result.get('CreateResult', result)
+            if result.get('Errors') or 'Object' not in result:
+                outcomes.append(str((result.get('Errors') or ['no item in the response'])[0]))
+            else:
+                outcomes.append(self._mockItem(result['Object']))
+        return outcomes
+
+
+    def _createdBuilds(self, int_work_items):
+        """
+            Return a list parallel to int_work_items holding the Build Agile Central has for each
+            (matched on BuildDefinition and Number), or None for those it doesn't have.
+        """
+        keys    = []
+        lookups = {}  # BuildDefinition ObjectID : set of Numbers to look up
+        for int_work_item in int_work_items:
+            bdf_oid = int_work_item['BuildDefinition'].rstrip('/').split('/')[-1]
+            key = self.buildKey(MockBuild({'ObjectID': bdf_oid}), int_work_item['Number'])
+            keys.append(key)
+            if key:
+                lookups.setdefault(key[0], set()).add(key[1])
+
+        found = {}
+        for bdf_oid, numbers in lookups.items():
+            criteria = 'BuildDefinition.ObjectID = %s' % bdf_oid
+            response = self._getByValues('Build', 'Number', numbers, criteria, fetch=BATCH_CREATE_FETCH,
+                                         workspace=self.workspace_name, project=None, pagesize=200)
+            for build in response:
+                found.setdefault(self.buildKey(build.BuildDefinition, build.Number), build)
+        return [found.get(key) if key else None for key in keys]
+
+
+    def _mockItem(self, item):
+        """
+            Wrap the JSON representation of an item in a MockBuild, with its BuildDefinition (if any)
+            wrapped likewise, so it can stand in for the pyral entity that create would have returned.
+        """
+        attributes = dict(item)
+        attributes['ref'] = item.get('_ref')
+        attributes['oid'] = item.get('ObjectID')
+        build_defn = item.get('BuildDefinition')
+        if isinstance(build_defn, dict):
+            attributes['BuildDefinition'] = MockBuild({'Name'     : build_defn.get('_refObjectName'),
+                                                       'ref'      : build_defn.get('_ref'),
+                                                       'ObjectID' : build_defn.get('ObjectID')})
+        return MockBuild(attributes)
+
+
     def _createInternal(self, int_work_item):
 
         # snag the base Uri from the int_work_item['Uri'] burning off any ending '/' char
@@ -631,31 +1010,51 @@ class AgileCentralConnection(BLDConnection):
         return build
 
 
-    def buildExists(self, build_defn, number):
+    def buildKey(self, build_defn, number):
         """
-            Issue a query against Build to obtain the Build identified by build_defn.ObjectID and number.
-            Return a boolean indication of whether such an item exists.
+            Return the (BuildDefinition ObjectID, Number) key of a Build, or None when the Number isn't numeric
+            (eg, '1.2.3' for a Build posted by some other tool), such a Build can't be one of our builds.
         """
-        criteria = ['BuildDefinition.ObjectID = %s' % build_defn.ObjectID, 'Number = %s' % number]
-        response = self.agicen.get('Build', fetch="CreationDate,Number,Name,BuildDefinition,Project", query=criteria,
-                                            workspace=self.workspace_name, project=None)
+        try:
+            return (int(build_defn.ObjectID), int(number))
+        except (TypeError, ValueError):
+            return None
 
-        if response.resultCount:
-            return response.next()
-        return None
+    def recordedBuilds(self, candidates):
+        """
+            Given candidates, a sequence of (build_defn, number, timestamp) tuples where timestamp is
+            the epoch seconds at which the build completed, return a set of (BuildDefinition ObjectID, Number)
+            tuples for those candidates that already have a Build in Agile Central.
+            A candidate that completed at or after the reference time of the last getRecentBuilds call
+            could only have been recorded after that time, so the Builds getRecentBuilds retrieved settle it.
+            The remaining candidates are looked up with one query per BuildDefinition for every
+            chunk of Numbers instead of one query per candidate.
+        """
+        recorded = set()
+        lookups  = {}  # BuildDefinition ObjectID : set of Numbers to look up
+        for build_defn, number, timestamp in candidates:
+            key = self.buildKey(build_defn, number)
+            if key is None:
+                continue
+            if key in self.recent_build_keys:
+                recorded.add(key)
+            elif self.recent_builds_since is None or timestamp < self.recent_builds_since:
+                lookups.setdefault(key[0], set()).add(key[1])
+
+        for bdf_oid, numbers in lookups.items():
+            criteria = 'BuildDefinition.ObjectID = %s' % bdf_oid
+            response = self._getByValues('Build', 'Number', numbers, criteria, fetch="Number,BuildDefinition,ObjectID",
+                                         workspace=self.workspace_name, project=None, pagesize=200)
+            keys = (self.buildKey(build.BuildDefinition, build.Number) for build in response)
+            recorded.update(key for key in keys if key)
+
+        lookup_count = sum(len(numbers) for numbers in lookups.values())
+        self.log.debug("%d of %d candidate Builds already recorded in Agile Central, %d looked up" % \
+                       (len(recorded), len(candidates), lookup_count))
+        return recorded
 
 
     # def populateChangesetsCollectionOnBuild(self, build, changesets):
     #     csrefs = [{ "_ref" : "changeset/%s" % cs.oid} for cs in changesets]
     #     cs_coll_ref = build.Changesets
     #     #self.agicen.addCollection(cs_coll_ref, csrefs)
-
-    def matchToChangesets(self, vcs_commits):
-        valid_changesets = []
-        for commit in vcs_commits:
-            query = ('Revision = "%s"' % commit)
-            response = self.agicen.get("Changeset", fetch="ObjectID", query=query, workspace=self.workspace_name, project=None)
-            if response.resultCount > 0:
-                changeset = response.next()
-                valid_changesets.append(changeset)
-        return valid_changesets
@@ -5,14 +5,18 @@ import socket
 import re
 import time
 import calendar
+import threading
 
-import requests
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from bldeif.connection import BLDConnection
 from bldeif.utils.eif_exception import ConfigurationError, OperationalError
 from bldeif.utils.time_helper import TimeHelper
 from bldeif.utils.status_matchmaker import Matchmaker
+from bldeif.utils.http_transport import HTTPTransport
+from bldeif.utils.cache_file import CacheFile
+from bldeif.utils.json_stream import iterJSONArray
 
 
 quote = urllib.parse.quote
@@ -21,6 +25,12 @@ time_helper = TimeHelper()
 ############################################################################################
 __version__ = "0.0.1"
 
+PLAN_DISCOVERY_MODES = ['All', 'Configured']
+
+RESULTS_CHUNK_SIZE = 64 * 1024  # bytes read off the socket at a time when decoding results pages
+
+GIT_REVISION_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
 ############################################################################################
 
 
@@ -28,11 +38,16 @@ class BambooConnection(BLDConnection):
     def __init__(self, config, logger):
         super().__init__(logger)
         self.bamboo = None
+        self.transport = None
         self.internalizeConfig(config)
         self.backend_version = ""
         self.username_required = False
         self.password_required = False
         self.plans = [] #former self.inventory
+        self.inventory_cache = None
+        self.inventory_fingerprint = None
+        self.watermarks = {}  # keyed by plan key, build number up to which every build is reflected in AgileCentral
+        self.unfinished = {}  # keyed by plan key, lowest build number missing from the plan's results on the last scan
 
     def name(self):
         return "Babmoo"
@@ -58,6 +73,19 @@ class BambooConnection(BLDConnection):
         self.password   = config.get("Password", '')
         self.debug      = config.get("Debug", False)
         self.max_items  = config.get("MaxItems", 1000)
+        self.page_size  = int(config.get("PageSize", 25))
+        self.concurrency = max(1, int(config.get("Concurrency", 4)))  # number of plans whose results are fetched at once
+        self.pool_size  = int(config.get("PoolSize", max(10, self.concurrency)))
+        self.connect_timeout = float(config.get("ConnectTimeout", 10))
+        self.read_timeout    = float(config.get("ReadTimeout",    60))
+        self.retries         = int(config.get("Retries", 3))
+        self.retry_backoff   = float(config.get("RetryBackoff", 0.5))
+        self.skip_unchanged  = config.get("SkipUnchangedPlans", False)
+        self.plan_discovery  = config.get("PlanDiscovery", 'All')
+        if self.plan_discovery not in PLAN_DISCOVERY_MODES:
+            problem = "Bamboo section of the config has an invalid PlanDiscovery value: %s, valid values are: %s"
+            raise ConfigurationError(problem % (self.plan_discovery, ", ".join(PLAN_DISCOVERY_MODES)))
+        self.plan_cache_ttl  = int(config.get("PlanCacheTTL", 0)) * 60  # in minutes in the config, 0 means no caching
         self.projects   = []
         self.ac_project = config.get("AgileCentral_DefaultBuildProject", None)
 
@@ -76,7 +104,9 @@ class BambooConnection(BLDConnection):
                               'Username', 'User', 'Password',
                               'ProxyProtocol', 'ProxyServer', 'ProxyPort', 'ProxyUser', 'ProxyUsername',
                               'ProxyPassword',
-                              'Debug', 'Lookback',
+                              'Debug', 'Lookback', 'PageSize', 'Concurrency',
+                              'PoolSize', 'ConnectTimeout', 'ReadTimeout', 'Retries', 'RetryBackoff',
+                              'SkipUnchangedPlans', 'PlanDiscovery', 'PlanCacheTTL',
                               'AgileCentral_DefaultBuildProject',
                               'Projects'
                              ]
@@ -99,10 +129,16 @@ class BambooConnection(BLDConnection):
             #{'Fernandel': {'AgileCentral_Project': 'Rally Fernandel', 'Plans': ['DonCamillo', 'Ludovic Cruchot']}}
 
         self.builds = {}
+        self.builds_lock = threading.Lock()
 
 
     def connect(self):
         self.log.info("Connecting to Bamboo")
+        headers = {'Content-Type': 'application/json'}
+        self.transport = HTTPTransport(self.log, auth=self.creds, proxies=self.http_proxy, headers=headers,
+                                       pool_size=self.pool_size,
+                                       connect_timeout=self.connect_timeout, read_timeout=self.read_timeout,
+                                       retries=self.retries, backoff=self.retry_backoff)
         self.backend_version = self._getBambooVersion()
         self.log.info("Connected to Bamboo server: %s running at version %s" % (self.server, self.backend_version))
         self.log.info("Url: %s" % self.base_url)
@@ -112,14 +148,14 @@ class BambooConnection(BLDConnection):
         version  = None
         response = None
         bamboo_url = "%s/info.json" % self.base_url
-        headers = {'Content-Type': 'application/json'}
         self.log.debug(bamboo_url)
         try:
-            response = requests.get(bamboo_url, auth=self.creds, proxies=self.http_proxy, headers=headers)
+            response = self.transport.get(bamboo_url)
         except Exception as msg:
             self.log.error(msg)
+            raise ConfigurationError('Unable to connect to Bamboo at %s: %s' % (bamboo_url, msg))
         if response.status_code >= 300:
-            raise ConfigurationError('%s  status_code: %s' % (msg, response.status_code))
+            raise ConfigurationError('%s  status_code: %s' % (bamboo_url, response.status_code))
 
         # self.log.debug(response.headers)
         result = response.json()
@@ -127,19 +163,148 @@ class BambooConnection(BLDConnection):
             return result['version']
 
     def disconnect(self):
+        if self.transport:
+            self.transport.close()
+        self.transport = None
         self.bamboo = None
 
+    def setWatermarks(self, watermarks):
+        """
+            watermarks is a dict keyed by plan key with values that are dicts with a 'number' key.
+            Results at or below a plan's watermark number are not requested on subsequent scans,
+            see settledNumber for how a watermark is kept below the builds that haven't finished yet.
+        """
+        self.watermarks = watermarks or {}
+
     def getRecentBuilds(self, ref_time):
+        """
+            Results for the plans are fetched by a pool of up to self.concurrency workers.
+            Each worker hands back the qualifying builds of one plan (in chronological order)
+            and those are merged into self.builds in plan order.
+        """
         ref_time = calendar.timegm(ref_time)
         recent_builds_count = 0
-        all_projects = self.getProjects()
+        self.builds = {}  # a long running connector polls repeatedly, only this scan's builds are of interest
+        self.discoverPlans()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            plan_builds = pool.map(lambda plan: self.collectBuildsPerPlan(plan.key, ref_time), self.plans)
+            for builds in plan_builds:
+                self.storePlanBuilds(builds)
+        self.log.debug("Bamboo request latency: %s" % self.transport.latencySummary())
+        return self.builds
 
-        self.getPlans(all_projects)
+    def iterRecentBuilds(self, ref_time):
+        """
+            Generator of (ac_project, plan, builds) for each plan with qualifying builds, in the order
+            in which the plans' results come in rather than plan order (the builds are also stored in self.builds).
+            No more than self.concurrency plans are fetched ahead of the consumer, a consumer that
+            doesn't keep up holds back the fetching.
+        """
+        ref_time = calendar.timegm(ref_time)
+        self.builds = {}  # a long running connector polls repeatedly, only this scan's builds are of interest
+        self.discoverPlans()
+
+        plans = iter(self.plans)
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            def fetchNextPlan():
+                plan = next(plans, None)
+                if plan:
+                    in_flight.add(pool.submit(self.collectBuildsPerPlan, plan.key, ref_time))
+
+            for i in range(self.concurrency):
+                fetchNextPlan()
+            while in_flight:
+                done, not_done = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.remove(future)
+                    builds = future.result()
+                    if builds:
+                        self.storePlanBuilds(builds)
+                        yield self.getAgileCentralProject(builds[0].project), builds[0].plan, builds
+                    fetchNextPlan()
+        self.log.debug("Bamboo request latency: %s" % self.transport.latencySummary())
+
+
+    def useInventoryCache(self, filename, fingerprint):
+        """
+            Have the resolved plan inventory persisted in filename for PlanCacheTTL minutes.
+            The fingerprint (eg, derived from the config file modification time) is recorded
+            with the inventory, a cached inventory with a different fingerprint is not used.
+        """
+        if self.plan_cache_ttl > 0:
+            self.inventory_cache = CacheFile(filename, self.log, ttl=self.plan_cache_ttl)
+            self.inventory_fingerprint = "%s|%s" % (fingerprint, self.plan_discovery)
 
-        for plan in self.plans:
-            self.getBuildsPerPlan(plan.key, ref_time)
-        return self.builds
+    def invalidateInventoryCache(self):
+        """
+            Have the next discoverPlans resolve the plans anew, eg. once a plan turns out to be gone from Bamboo
+        """
+        self.plans = []
+        if self.inventory_cache:
+            self.inventory_cache.invalidate()
+
+    def discoverPlans(self):
+        """
+            Populate self.plans with the plans whose results are of interest.
+            With PlanDiscovery set to 'All' the whole project/plan inventory of the Bamboo server
+            is listed and every plan of a configured project is selected (every time this is called).
+            With PlanDiscovery set to 'Configured' only the configured projects are requested,
+            only the configured Plans of those are selected and this resolution is done once.
+            Either way, an unexpired inventory cache takes the place of the requests.
+        """
+        if self.plan_discovery == 'Configured' and self.plans:
+            return self.plans
+
+        cached_plans = self.readInventoryCache()
+        if cached_plans is not None:
+            self.plans = cached_plans
+            return self.plans
 
+        if self.plan_discovery == 'Configured':
+            self.plans = self.getConfiguredPlans()
+        else:
+            all_projects = self.getProjects()
+            self.plans = []
+            self.getPlans(all_projects)
+        self.writeInventoryCache()
+        return self.plans
+
+    def readInventoryCache(self):
+        """
+            Return a list of BambooPlan instances from the inventory cache
+            or None when there is no usable cache.
+        """
+        if not self.inventory_cache:
+            return None
+        inventory = self.inventory_cache.read(self.inventory_fingerprint)
+        if inventory is None:
+            return None
+        plans = [BambooPlan(raw_plan) for project in inventory.values() for raw_plan in project['Plans']]
+        self.log.debug("%d plans obtained from the inventory cache %s" % (len(plans), self.inventory_cache.filename))
+        return plans
+
+    def writeInventoryCache(self):
+        """
+            Persist self.plans grouped by Bamboo project along with the AgileCentral project
+            each Bamboo project is mapped to, eg:
+               {"Fernandel": {"AgileCentral_Project": "Rally Fernandel",
+                              "Plans": [{"key": "FER-DON", "name": "Fernandel - DonCamillo", "shortName": "DonCamillo",
+                                         "link": {"href": "http://localhost:8085/rest/api/latest/plan/FER-DON"}}]}}
+        """
+        if not self.inventory_cache:
+            return
+        inventory = {}
+        for plan in self.plans:
+            if plan.project not in inventory:
+                inventory[plan.project] = {'AgileCentral_Project': self.getAgileCentralProject(plan.project), 'Plans': []}
+            raw_plan = {'key': plan.key, 'name': plan.full_name, 'shortName': plan.name, 'link': {'href': plan.link}}
+            inventory[plan.project]['Plans'].append(raw_plan)
+        try:
+            self.inventory_cache.write(inventory, self.inventory_fingerprint)
+        except Exception as msg:
+            self.log.error("Unable to write the plan inventory cache %s: %s" % (self.inventory_cache.filename, msg))
 
     def getProjects(self):
         """
@@ -148,9 +313,8 @@ class BambooConnection(BLDConnection):
         """
         all_projects = []
         endpoint = 'project.json?expand=projects.project.plans'
-        headers = {'Content-Type': 'application/json'}
         url = "%s/%s" % (self.base_url, endpoint)
-        response = requests.get(url, auth=self.creds, proxies=self.http_proxy, headers=headers)
+        response = self.transport.get(url)
         if response.status_code == 200:
             result = response.json()
             all_projects = result['projects']['project']
@@ -164,72 +328,223 @@ class BambooConnection(BLDConnection):
             for raw_plan in project['plans']['plan']:
                 self.plans.append(BambooPlan(raw_plan))
 
-
-    def getBuildsPerPlan(self, key, ref_time):
+    def getConfiguredPlans(self):
         """
-        curl --user toto:totogithub -g http://localhost:8085/rest/api/latest/result/FER-DON.json?expand=results[0:5].result | python -m json.tool
-
-        to get more details on vcsRevisions:
+            Resolve the configured Projects and Plans to a list of BambooPlan instances by
+            requesting only the configured projects instead of the whole Bamboo inventory.
+            A project's Plans entries may be plan names or plan keys, if the project has no
+            Plans entries all of its plans are selected.
+        """
+        project_keys = self.getProjectKeys()
+        plans = []
+        for project in self.projects:
+            for proj_name, details in project.items():
+                if proj_name not in project_keys:
+                    self.log.warning("Project '%s' mentioned in the config was not found in Bamboo" % proj_name)
+                    continue
+                raw_plans = self.getProjectPlans(project_keys[proj_name])
+                wanted = details.get('Plans') or []
+                if not wanted:
+                    plans.extend(BambooPlan(raw_plan) for raw_plan in raw_plans)
+                    continue
+                identifiers = {raw_plan['key']: {raw_plan['shortName'], raw_plan['key'], raw_plan.get('shortKey')}
+                                  for raw_plan in raw_plans}
+                selected = [raw_plan for raw_plan in raw_plans if identifiers[raw_plan['key']] & set(wanted)]
+                found = set().union(*[identifiers[raw_plan['key']] for raw_plan in selected])
+                for plan_name in [name for name in wanted if name not in found]:
+                    self.log.warning("Plan '%s' of project '%s' mentioned in the config was not found in Bamboo" % (plan_name, proj_name))
+                plans.extend(BambooPlan(raw_plan) for raw_plan in selected)
+        self.log.debug("%d plans resolved for the configured projects" % len(plans))
+        return plans
+
+    def getProjectKeys(self):
+        """
+            Return a dict of configured project name to Bamboo project key.
+            The project listing is requested without any plan information so the response stays small.
+            Projects are configured by name (as that's what their builds are mapped to an AgileCentral project by).
+                curl --user toto:totogithub http://localhost:8085/rest/api/latest/project.json?max-results=10000
+        """
+        conf_project_names = [proj_name for project in self.projects for proj_name in project.keys()]
+        url = "%s/project.json?max-results=10000" % self.base_url
+        response = self.transport.get(url)
+        if response.status_code != 200:
+            raise OperationalError("Unable to obtain the list of Bamboo projects, status_code: %s" % response.status_code)
+        project_keys = {}
+        for project in response.json()['projects']['project']:
+            if project['name'] in conf_project_names:
+                project_keys[project['name']] = project['key']
+        return project_keys
+
+    def getProjectPlans(self, project_key):
+        """
+            Return the raw plan records of the Bamboo project identified by project_key.
+                curl --user toto:totogithub http://localhost:8085/rest/api/latest/project/FER.json?expand=plans.plan
+        """
+        url = "%s/project/%s.json?expand=plans.plan&max-results=10000" % (self.base_url, project_key)
+        response = self.transport.get(url)
+        if response.status_code != 200:
+            raise OperationalError("Unable to obtain the plans of Bamboo project %s, status_code: %s" % (project_key, response.status_code))
+        return response.json()['plans']['plan']
 
-        curl --user toto:totogithub -g http://localhost:8085/rest/api/latest/result/FER-DON.json?expand=results[0:5].result.vcsRevisions | python -m json.tool
+    def collectBuildsPerPlan(self, key, ref_time):
+        """
+            Return a list of the BambooBuild instances for the plan identified by key that
+            completed at or after ref_time, in chronological order.  Nothing is stored in self.builds,
+            so this is safe to call from a worker thread.
 
-        vcs data seeps to be limited to:
-            "vcsRevision": [
-                        {
-                            "repositoryId": 360450,
-                            "repositoryName": "bamboo-camillo",
-                            "vcsRevisionKey": "561b474ef508710944574f4e33ea9f77a2abf69b"
-                        }
-                    ]
-         Is it possible to get revision's commit message and timestamp?
-         Yes, but only by hitting a separate endpoint per build result, e.g.
-         http://localhost:8085/rest/api/latest/result/FER-DON/74.json?expand=changes.change.files,vcsRevisions
+            curl --user toto:totogithub -g http://localhost:8085/rest/api/latest/result/FER-DON.json?expand=results[0:5].result | python -m json.tool
 
+            Results come back newest first, one page of PageSize results at a time, e.g.
+            endpoint = 'result/%s.json?expand=results.result&start-index=50&max-results=25' % key
+            Pages are requested only until a result completed before ref_time shows up,
+            so a plan with a long history costs no more than the pages holding its recent results.
+            The vcsRevisions are not expanded in the listing, see expandVCSData.
+        """
+        if self.skip_unchanged and not self.planHasNewResults(key, ref_time):
+            self.log.debug("No new results for plan %s, skipping it" % key)
+            return []
+        return self.extractQualifyingBuilds(self._iterPlanResults(key, ref_time), ref_time)
 
-         Paging:
+    def planHasNewResults(self, key, ref_time):
+        """
+            Ask Bamboo for just the most recent result of the plan identified by key.
+            The plan has new results if that result is numbered above the plan's watermark and either
+            the plan has a watermark (which stays below any build that finished out of order, so results
+            above it may still be pending) or the result completed at or after ref_time.
+            If the probe can't tell (non-200 response), the answer is True so the regular results fetch sorts it out.
+        """
+        url = "%s/result/%s.json?expand=results.result&max-results=1" % (self.base_url, key)
+        response = self.transport.get(url)
+        if response.status_code != 200:
+            return True
+        latest = response.json()['results']['result']
+        if not latest:
+            return False
+        record = latest[0]
+        watermark = self.watermarks.get(key, {}).get('number', 0)
+        if int(record['number']) <= watermark:
+            return False
+        if watermark:
+            return True
+        return time_helper.secondsFromString(record['buildCompletedTime']) >= ref_time
 
-         endpoint = 'result/%s.json?expand=results[0:200].result.vcsRevisions' % key
-         results[0:max] returns 25 results (one page) per plan. If there are more than 25 results per plan paging
-         will be necessary. E.g. if one plan has 70 results, another 80, third 10, only 60 (25+25+10) will be returned
-         instead of paging, use max-results=1000000 with arbitrary large number
-         E.g. the endpoint below will return all 160 (80+70+10) results
-         endpoint = 'result/%s.json?expand=results.result.vcsRevisions&max-results=1000000' % key
+    def _iterPlanResults(self, key, ref_time):
         """
-        raw_builds = []
-        endpoint = 'result/%s.json?expand=results.result.vcsRevisions&max-results=1000000' % key
-        headers = {'Content-Type': 'application/json'}
-        url = "%s/%s" % (self.base_url, endpoint)
-        response = requests.get(url, auth=self.creds, proxies=self.http_proxy, headers=headers)
-        if response.status_code == 200:
-            result = response.json()
-            raw_builds = result['results']['result']
-            if raw_builds:
-                self.extractQualifyingBuilds(raw_builds, ref_time)
+            Walk the result pages of the plan identified by key (newest result first) and
+            yield the raw result records completed at or after ref_time and numbered above
+            the plan's watermark.  No further pages are requested once a record failing
+            either condition is encountered.
+            Bamboo lists only finished results, so a number missing from the records walked
+            belongs to a build that hasn't finished yet (or whose result was deleted), those are
+            noted so that the watermark of the plan can be kept below them (see settledNumber).
+        """
+        watermark = self.watermarks.get(key, {}).get('number', 0)
+        seen  = set()  # numbers of the records walked
+        floor = None   # number below which the records weren't walked
+        start_index = 0
+        try:
+            while True:
+                endpoint = 'result/%s.json?expand=results.result&start-index=%d&max-results=%d' % \
+                           (key, start_index, self.page_size)
+                url = "%s/%s" % (self.base_url, endpoint)
+                # the page is decoded record by record as it comes off the socket rather than all at once
+                response = self.transport.get(url, stream=True)
+                page_count = 0
+                try:
+                    if response.status_code != 200:
+                        self.log.warning("Unable to retrieve results for plan %s, status_code: %s" % (key, response.status_code))
+                        if response.status_code == 404:  # the plan is gone, the inventory is to be discovered anew
+                            self.invalidateInventoryCache()
+                        seen = set()  # nothing can be told about the plan's unfinished builds
+                        return
+                    records = iterJSONArray(response.iter_content(chunk_size=RESULTS_CHUNK_SIZE), ('results', 'result'))
+                    for record in records:
+                        page_count += 1
+                        number = int(record['number'])
+                        if number <= watermark or \
+                           time_helper.secondsFromString(record['buildCompletedTime']) < ref_time:
+                            floor = max(number, watermark)
+                            return
+                        seen.add(number)
+                        yield record
+                finally:
+                    response.close()
+                start_index += page_count
+                if page_count < self.page_size:
+                    return
+        finally:
+            if floor is None and seen:  # every result of the plan was walked
+                floor = watermark or min(seen) - 1
+            self._noteUnfinishedBuilds(key, floor, seen)
+
+    def _noteUnfinishedBuilds(self, key, floor, seen):
+        """
+            Record the lowest number above floor missing from the seen numbers of the plan identified by key.
+        """
+        missing = [number for number in range(floor + 1, max(seen)) if number not in seen] if seen else []
+        with self.builds_lock:
+            if missing:
+                self.log.debug("Plan %s build #%d has not finished yet" % (key, missing[0]))
+                self.unfinished[key] = missing[0]
+            else:
+                self.unfinished.pop(key, None)
+
+    def settledNumber(self, key, number):
+        """
+            Results of a plan don't necessarily finish in build number order (eg, with concurrent stages or agents),
+            so the watermark of the plan identified by key can be raised to a reflected build's number only
+            when no lower numbered build was unfinished when the plan was last scanned.
+            Return number, or the number just below the lowest such unfinished build.
+        """
+        with self.builds_lock:
+            unfinished = self.unfinished.get(key)
+        if unfinished is not None and unfinished <= number:
+            return unfinished - 1
+        return number
 
     def extractQualifyingBuilds(self, raw_builds, ref_time):
-        build_count = 0
-        # ac_project = self.getAgileCentralProject(raw_builds[0]['projectName'])
-        # if ac_project not in self.builds:
-        #     self.builds[ac_project] = {}
-        # plan = BambooPlan(raw_builds[0]['plan'])
-        # self.builds[ac_project][plan] = []
-
+        """
+            raw_builds is an iterable of raw result records for a single plan, most recent first.
+            Returns a list of BambooBuild instances for the records completed at or after ref_time,
+            in chronological order.
+        """
+        builds = []
         for record in raw_builds:
             timestamp = time_helper.secondsFromString(record['buildCompletedTime'])
-            if timestamp >= ref_time:
-                build_count += 1
-                # prep builds dict when there is at least one qualified build:
-                if build_count == 1:
-                    ac_project = self.getAgileCentralProject(record['projectName'])
-                    if ac_project not in self.builds:
-                        self.builds[ac_project] = {}
-                    plan = BambooPlan(record['plan'])
-                    self.builds[ac_project][plan] = []
-
-                build = BambooBuild(record)
-                self.builds[ac_project][plan].append(build)
-        if build_count > 1:
-            self.builds[ac_project][plan] = self.builds[ac_project][plan][::-1]
+            if timestamp < ref_time:
+                break  # results are ordered most recent first, nothing further can qualify
+            builds.append(BambooBuild(record))
+        return builds[::-1]
+
+    def expandVCSData(self, build):
+        """
+            Populate the changeSets, repository and vcs attributes of the BambooBuild instance
+            from the revision and change details of the build result, e.g.
+                curl --user toto:totogithub http://localhost:8085/rest/api/latest/result/FER-DON-74.json?expand=changes.change,vcsRevisions
+            This costs a request per build, so it is done only for builds about to be posted.
+        """
+        if build.vcs_expanded:
+            return build
+        url = "%s/result/%s.json?expand=changes.change,vcsRevisions" % (self.base_url, build.key)
+        response = self.transport.get(url)
+        if response.status_code != 200:
+            raise OperationalError("Unable to retrieve changes for build %s, status_code: %s" % (build.key, response.status_code))
+        build.addVCSData(response.json())
+        return build
+
+    def storePlanBuilds(self, builds):
+        """
+            Put the chronologically ordered builds of a single plan into self.builds,
+            keyed by the AgileCentral project and then the plan.
+        """
+        if not builds:
+            return
+        ac_project = self.getAgileCentralProject(builds[0].project)
+        plan = builds[0].plan
+        with self.builds_lock:
+            if ac_project not in self.builds:
+                self.builds[ac_project] = {}
+            self.builds[ac_project][plan] = builds
 
 
     def getAgileCentralProject(self, bamboo_project_name):
@@ -309,6 +624,22 @@ class BambooBuild:
         self.timestamp = time_helper.secondsFromString(self.completed_time)
         self.project   = raw['projectName']
         self.duration = int(raw['buildDuration'])
+        self.changeSets = []   # populated by BambooConnection.expandVCSData
+        self.repository = None
+        self.vcs        = None
+        self.vcs_expanded = False
+
+    def addVCSData(self, raw):
+        """
+            raw is a build result with the changes.change and vcsRevisions expanded.
+            Without a revision there's no repository to attribute the changes to, they're left out.
+        """
+        revisions = raw.get('vcsRevisions', {}).get('vcsRevision', [])
+        if revisions:
+            self.repository = revisions[0]['repositoryName']
+            self.vcs = 'git' if GIT_REVISION_PATTERN.match(revisions[0]['vcsRevisionKey']) else 'Bamboo'
+            self.changeSets = [BambooChangeset(change, self.vcs) for change in raw.get('changes', {}).get('change', [])]
+        self.vcs_expanded = True
 
     def as_tuple_data(self):
         iso_str_start = time_helper.stringFromSeconds(self.started_timestamp, '%Y-%m-%dT%H:%M:%SZ')
@@ -320,3 +651,20 @@ class BambooBuild:
                       ('Uri', self.url)]
         return build_data
 
+###########################################################################################
+
+class BambooChangeset:
+    def __init__(self, raw, vcs):
+        """
+            raw is an element of the changes.change list of an expanded build result
+        """
+        self.commitId  = raw['changesetId']
+        self.message   = raw.get('comment', '')
+        self.author    = raw.get('author', '')
+        self.uri       = raw.get('commitUrl', '')
+        self.timestamp = time_helper.secondsFromString(raw['date']) * 1000  # in milliseconds
+        self.vcs       = vcs
+
+    def __str__(self):
+        return "%s %s %s" % (self.commitId, self.author, self.message)
+
@@ -6,10 +6,14 @@
 import sys, os, platform
 import time
 import re
+import threading
+import queue
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from bldeif.utils.eif_exception   import FatalError, ConfigurationError, OperationalError
 from bldeif.utils.claslo          import ClassLoader
+from bldeif.utils.watermark_file  import WatermarkFile
 
 ##############################################################################################
 
@@ -20,6 +24,8 @@ PLAIN_PLUGIN_SPEC_PATTERN = re.compile(r'(?P<plugin_class>\w+)\s*$')
 
 ARCHITECTURE_PKG = 'bldeif'
 
+QUEUE_POLL_INTERVAL = 0.5  # secs a pipelined reflect waits on its plan queue before checking for a stop
+
 ##############################################################################################
 
 class BLDConnector:
@@ -61,11 +67,16 @@ class BLDConnector:
         except Exception as msg:
             raise FatalError('Unable to load %sConnection class, %s' % (self.bld_name, msg))
 
+        self.startup_timings = OrderedDict()
+        started = time.time()
         self.establishConnections()
 
         if not self.validate():  # basically just calls validate on both connection instances
             raise ConfigurationError("Validation failed")
+        self.startup_timings['total'] = time.time() - started
         self.log.info("Initialization complete: Delegate connections operational, ready for scan/reflect ops")
+        self.log.info("Startup timing: %s" % ", ".join("%s %.3f secs" % (step, secs)
+                                                        for step, secs in self.startup_timings.items()))
 
 
     def internalizeConfig(self, config):
@@ -80,9 +91,13 @@ class BLDConnector:
         self.agicen_conf['Project'] = self.bld_conf['AgileCentral_DefaultBuildProject']
         self.svc_conf    = config.topLevel('Service')
         self.max_builds  = self.svc_conf.get('MaxBuilds', 20)
+        self.show_vcs_data = self.svc_conf.get('ShowVCSData', False)
+        self.pipeline      = self.svc_conf.get('Pipeline', False)  # post the builds of each plan as soon as they're in
+        self.concurrent_scans = self.svc_conf.get('ConcurrentScans', False)  # scan both systems at the same time
+        self.lazy_connect  = self.svc_conf.get('LazyConnect', False)  # connect to Agile Central only when there are builds
         default_project = self.agicen_conf['Project']
 
-        valid_config_items = ['Preview', 'LogLevel', 'MaxBuilds', 'ShowVCSData', 'SecurityLevel' ]
+        valid_config_items = ['Preview', 'LogLevel', 'MaxBuilds', 'ShowVCSData', 'SecurityLevel', 'Pipeline', 'ConcurrentScans', 'LazyConnect' ]
         svc_conf = config.topLevel('Service')
         invalid_config_items = [item for item in svc_conf.keys() if item not in valid_config_items]
         if invalid_config_items:
@@ -107,14 +122,69 @@ class BLDConnector:
 
         self.target_projects = list(set(self.target_projects))  # to obtain unique project names
 
+        # per-plan build number watermarks live alongside the time file, eg. logs/camillo_watermark.file
+        self.watermark_file = WatermarkFile(self.stateFileName('watermark.file'), self.log)
+        self.watermark_lock = threading.Lock()
+
+    def stateFileName(self, suffix):
+        """
+            Return the name of a file in the logs subdir used to keep state between runs for
+            the current config, eg. logs/camillo_plans.cache for a suffix of 'plans.cache'
+        """
+        config_name = re.sub(r'\.(yml|cfg)$', '', os.path.basename(self.config.config_file_name))
+        return 'logs/%s_%s' % (config_name, suffix)
+
+    def configFingerprint(self):
+        """
+            Cached state derived from the config is no longer valid once the config file is modified
+        """
+        config_path = getattr(self.config, 'config_file_path', None)
+        if config_path and os.path.exists(config_path):
+            return "%s:%d" % (os.path.basename(config_path), int(os.path.getmtime(config_path)))
+        return None
+
 
 
     def establishConnections(self):
+        """
+            The connection to the build system (including its version probe) and the connection to
+            Agile Central followed by the lookup of the configured projects are established at the same time.
+            The build system version is part of the integration headers sent to Agile Central, those
+            are brought up to date once both connections are in place.
+        """
         self.agicen_conn = self.agicen_conn_class(self.agicen_conf, self.log)
         self.bld_conn    =    self.bld_conn_class(self.bld_conf,    self.log)
+        if hasattr(self.bld_conn, 'useInventoryCache'):
+            self.bld_conn.useInventoryCache(self.stateFileName('plans.cache'), self.configFingerprint())
 
-        self.bld_conn.connect()  # we do this before agicen_conn to be able to get the bld backend version
-        bld_backend_version = self.bld_conn.getBackendVersion()
+        self.agicen_conn.setSourceIdentification(self.bld_conn.name(), self.bld_conn.backend_version)
+        if hasattr(self.agicen_conn, 'useBuildDefinitionCache'):
+            self.agicen_conn.useBuildDefinitionCache(self.stateFileName('builddefs.cache'), self.configFingerprint())
+        if hasattr(self.agicen_conn, 'usePrefixCache'):
+            self.agicen_conn.usePrefixCache(self.stateFileName('prefixes.cache'), self.configFingerprint())
+        if hasattr(self.agicen_conn, 'useArtifactCache'):
+            self.agicen_conn.useArtifactCache(self.stateFileName('artifacts.cache'), self.configFingerprint())
+
+        def connectBuildSystem():
+            self.bld_conn.connect()
+            return self.bld_conn.getBackendVersion()
+
+        def connectAgileCentral():
+            self._timed('Agile Central connect', self.agicen_conn.connect)
+            return self._timed('Agile Central projects', self._validateAgileCentralProjects)
+
+        # with LazyConnect the connection to Agile Central waits until there are builds to reflect
+        self.agicen_connected = False
+        self.agicen_projects_valid = False
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            bld_connect    = pool.submit(self._timed, '%s connect' % self.bld_name, connectBuildSystem)
+            agicen_connect = None
+            if not self.lazy_connect:
+                agicen_connect = pool.submit(connectAgileCentral)
+        bld_backend_version = bld_connect.result()  # a build system connection problem takes precedence
+        if agicen_connect:
+            self.agicen_projects_valid = agicen_connect.result()
+            self.agicen_connected = True
 
         if self.agicen_conn and self.bld_conn and getattr(self.agicen_conn, 'set_integration_header'):
             agicen_headers = {'name'    : 'Agile Central BLDConnector for %s' % self.bld_name,
@@ -123,25 +193,40 @@ class BLDConnector:
                               'other_version' : bld_backend_version
                             }
             self.agicen_conn.set_integration_header(agicen_headers)
-        self.agicen_conn.setSourceIdentification(self.bld_conn.name(), self.bld_conn.backend_version)
-        self.agicen_conn.connect()  # so we can use it in our X-Rally-Integrations header items here
+
+
+    def _timed(self, step, operation, *args):
+        """
+            Call operation with args and record how long it took under step in self.startup_timings
+        """
+        started = time.time()
+        try:
+            return operation(*args)
+        finally:
+            self.startup_timings[step] = time.time() - started
 
 
     def validate(self):
         """
-            This calls the validate method on both the Agile Central and the BLD connections
+            This calls the validate method on both the Agile Central and the BLD connections.
+            The Agile Central projects have already been looked up by establishConnections
+            (unless that was deferred by LazyConnect), only the outcome is reported here.
         """
         self.log.info("Connector validation starting")
 
         if not self.agicen_conn.validate():
             self.log.info("AgileCentralConnection validation failed")
             return False
-        if not self.agicen_conn.validateProjects(self.target_projects):
-            self.log.info("AgileCentralConnection validation for Projects failed")
-            return False
-        self.log.info("AgileCentralConnection validation succeeded")
 
-        if not self.bld_conn.validate():
+        if self.agicen_connected:
+            if not self.agicen_projects_valid:
+                self.log.info("AgileCentralConnection validation for Projects failed")
+                return False
+            self.log.info("AgileCentralConnection validation succeeded")
+        else:
+            self.log.info("AgileCentralConnection connection and validation deferred until there are builds to reflect")
+
+        if not self._timed('%s validation' % self.bld_name, self.bld_conn.validate):
             self.log.info("%sConnection validation failed" % self.bld_name)
             return False
         self.log.info("%sConnection validation succeeded" % self.bld_name)
@@ -153,6 +238,30 @@ class BLDConnector:
         return True
 
 
+    def _validateAgileCentralProjects(self):
+        if not self.agicen_conn.validateProjects(self.target_projects):
+            return False
+        if hasattr(self.agicen_conn, 'warmBuildDefinitionCache'):
+            self.agicen_conn.warmBuildDefinitionCache(self.target_projects)
+        return True
+
+
+    def ensureAgileCentralConnected(self):
+        """
+            With LazyConnect, the connection to Agile Central is established and validated
+            the first time there are builds to reflect in Agile Central.
+        """
+        if self.agicen_connected:
+            return
+        started = time.time()
+        self._timed('Agile Central connect', self.agicen_conn.connect)
+        if not self._timed('Agile Central projects', self._validateAgileCentralProjects):
+            self.log.info("AgileCentralConnection validation for Projects failed")
+            raise ConfigurationError("Validation failed")
+        self.agicen_connected = True
+        self.log.info("AgileCentralConnection validation succeeded, deferred connection took %.3f secs" % (time.time() - started))
+
+
     def run(self, secs_last_run, extension):
         """
             The real beef is in the call to reflectBuildsInAgileCentral.
@@ -202,9 +311,25 @@ class BLDConnector:
 
 
         agicen_ref_time, bld_ref_time = self.getRefTimes(secs_last_run)
-        recent_agicen_builds = agicen.getRecentBuilds(agicen_ref_time, self.target_projects)
-        recent_bld_builds    =    bld.getRecentBuilds(bld_ref_time)
-        unrecorded_builds = self._identifyUnrecordedBuilds(recent_agicen_builds, recent_bld_builds)
+        self.watermark_file.read()
+        if hasattr(bld, 'setWatermarks'):
+            bld.setWatermarks(self.watermark_file.watermarks)
+        outcomes = None
+        if not self.agicen_connected:
+            # LazyConnect, the build system is asked first and Agile Central is only consulted when there are builds
+            recent_bld_builds = bld.getRecentBuilds(bld_ref_time)
+            if not any(builds for plan_builds in recent_bld_builds.values() for builds in plan_builds.values()):
+                self.log.info("No recent builds in %s, Agile Central was not consulted" % self.bld_name)
+                return status, OrderedDict()
+            self.ensureAgileCentralConnected()
+            recent_agicen_builds = agicen.getRecentBuilds(agicen_ref_time, self.target_projects)
+            unrecorded_builds = self._identifyUnrecordedBuilds(recent_agicen_builds, recent_bld_builds)
+        elif self.pipeline and hasattr(bld, 'iterRecentBuilds'):
+            recent_agicen_builds = agicen.getRecentBuilds(agicen_ref_time, self.target_projects)
+            unrecorded_builds, outcomes = self._reflectPipelined(recent_agicen_builds, bld_ref_time, preview_mode)
+        else:
+            recent_agicen_builds, recent_bld_builds = self._scanRecentBuilds(agicen_ref_time, bld_ref_time)
+            unrecorded_builds = self._identifyUnrecordedBuilds(recent_agicen_builds, recent_bld_builds)
         self.log.info("unrecorded Builds count: %d" % len(unrecorded_builds))
         self.log.info("no more than %d builds per plan will be recorded on this run" % self.max_builds)
         #if self.svc_conf.get('ShowVCSData', False):
@@ -213,7 +338,7 @@ class BLDConnector:
         recorded_builds = OrderedDict()
         builds_posted = {}
         # sort the unrecorded_builds into build chrono order, oldest to most recent, then project and job
-        unrecorded_builds.sort(key=lambda build_info: (build_info[1].timestamp, build_info[2], build_info[1]))
+        unrecorded_builds.sort(key=self._chronologicalOrder)
         self.log.debug("About to process %d unrecorded builds" % len(unrecorded_builds))
         # for job, build, project, view in unrecorded_builds:
         #     if build.result == 'None':
@@ -237,46 +362,322 @@ class BLDConnector:
                 continue
             if preview_mode:
                 continue
+
+        if outcomes is None:
+            outcomes = self._reflectUnrecordedBuilds(unrecorded_builds, preview_mode)
+
+        # tally the outcomes in the chronological order of the unrecorded builds, regardless of
+        # the order in which the workers got to them
+        for plan, build, ac_project in unrecorded_builds:
+            if (plan.key, build.number) not in outcomes:
+                continue
+            agicen_build, build_status = outcomes[(plan.key, build.number)]
+            if agicen_build and build_status == 'posted':
+                builds_posted[plan] += 1
+                if plan not in recorded_builds:
+                    recorded_builds[plan] = []
+                recorded_builds[plan].append(agicen_build)
+            status = True
+
+        return status, recorded_builds
+
+    def _scanRecentBuilds(self, agicen_ref_time, bld_ref_time):
+        """
+            Obtain the recent builds from Agile Central and from the build system.  The two scans don't
+            depend on each other, so with ConcurrentScans they run at the same time and the scanning takes
+            as long as the slower of the two rather than their sum.  Should either scan fail, its
+            exception is raised here once both have finished.
+        """
+        def timedScan(system, scan, *args):
+            started = time.time()
+            recent_builds = scan(*args)
+            self.log.info("%s recent builds scan took %.3f secs" % (system, time.time() - started))
+            return recent_builds
+
+        agicen_scan = ('Agile Central', self.agicen_conn.getRecentBuilds, agicen_ref_time, self.target_projects)
+        bld_scan    = (self.bld_name,   self.bld_conn.getRecentBuilds,    bld_ref_time)
+        if not self.concurrent_scans:
+            return timedScan(*agicen_scan), timedScan(*bld_scan)
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            agicen_future = pool.submit(timedScan, *agicen_scan)
+            bld_future    = pool.submit(timedScan, *bld_scan)
+        try:
+            recent_agicen_builds = agicen_future.result()
+            recent_bld_builds    = bld_future.result()
+        except Exception as msg:
+            self.log.error("Scanning for recent builds failed: %s" % msg)
+            raise
+        self.log.info("Concurrent recent builds scans took %.3f secs" % (time.time() - started))
+        return recent_agicen_builds, recent_bld_builds
+
+    def _chronologicalOrder(self, build_info):
+        plan, build, ac_project = build_info
+        return (build.timestamp, ac_project, plan.key, build.number)
+
+    def _reflectUnrecordedBuilds(self, unrecorded_builds, preview_mode):
+        """
+            Reflect the chronologically ordered unrecorded_builds in Agile Central.
+            Returns the outcomes of _reflectDefinitionBuilds for all of them.
+        """
+        # the watermark of a plan is written once the last of its unrecorded builds has been handled
+        final_builds  = {plan.key: build for plan, build, ac_project in unrecorded_builds}
+        stalled_plans = set()
+        build_defns, existing_builds = self._prepareDefinitions(unrecorded_builds, stalled_plans)
+
+        # the builds of each BuildDefinition are reflected in chronological order (so that its LastBuild
+        # ends up being the most recent one) by one worker, different BuildDefinitions are handled concurrently
+        definition_builds = OrderedDict()
+        for plan, build, ac_project in unrecorded_builds:
+            if (ac_project, plan.name) in build_defns:
+                definition_builds.setdefault((ac_project, plan.name), []).append((plan, build, ac_project))
+
+        def reflectDefinitionBuilds(builds):
+            return self._reflectDefinitionBuilds(builds, build_defns, existing_builds, preview_mode,
+                                                 final_builds, stalled_plans)
+
+        workers = getattr(self.agicen_conn, 'concurrency', 1)
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for definition_outcomes in pool.map(reflectDefinitionBuilds, definition_builds.values()):
+                outcomes.update(definition_outcomes)
+        return outcomes
+
+    def _prepareDefinitions(self, unrecorded_builds, stalled_plans):
+        """
+            Ensure the BuildDefinitions for the unrecorded_builds exist and, with those in hand,
+            determine in bulk (rather than with a query per build) which unrecorded builds Agile Central already has.
+            Returns the BuildDefinitions keyed by (ac_project, plan name) and the set of keys of the recorded builds.
+        """
+        agicen = self.agicen_conn
+        build_defns = {}
         for plan, build, ac_project in unrecorded_builds:
+            if (ac_project, plan.name) in build_defns or plan.key in stalled_plans:
+                continue
+            try:
+                build_defns[(ac_project, plan.name)] = agicen.ensureBuildDefinitionExists(plan, ac_project)
+            except Exception as msg:
+                self.log.error('OperationalException prepACBuildPrerequisites - %s' % msg)
+                stalled_plans.add(plan.key)
+        candidates = [(build_defns[(ac_project, plan.name)], build.number, build.timestamp)
+                       for plan, build, ac_project in unrecorded_builds if (ac_project, plan.name) in build_defns]
+        existing_builds = agicen.recordedBuilds(candidates)
+        return build_defns, existing_builds
+
+    def _reflectPipelined(self, agicen_builds, bld_ref_time, preview_mode):
+        """
+            Rather than waiting for the recent builds of every plan, have the recent builds of each plan
+            flow from the build system connection through a bounded queue to workers that identify the
+            unrecorded ones and reflect them in Agile Central right away.  When the workers fall behind
+            the queue fills up, which holds back the fetching of further plans.
+            A plan whose builds can't be reflected is stalled and the workers carry on with the others.
+            Should a worker die nonetheless, the others and the fetching of plans stop rather than
+            wait on each other and the exception is raised here.
+            Returns the unrecorded builds and the outcomes of _reflectDefinitionBuilds for them.
+        """
+        workers = getattr(self.agicen_conn, 'concurrency', 1)
+        plan_queue = queue.Queue(maxsize=workers)
+        stop = threading.Event()
+        recorded_numbers = self._indexAgileCentralBuilds(agicen_builds)
+        unrecorded_builds = []
+        outcomes      = {}
+        final_builds  = {}
+        stalled_plans = set()
+        results_lock     = threading.Lock()
+        definition_locks = {}  # plans sharing a BuildDefinition take turns
+        failures = []
+
+        def put(plan_builds):
+            while not stop.is_set():
+                try:
+                    plan_queue.put(plan_builds, timeout=QUEUE_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for ac_project, plan, builds in self.bld_conn.iterRecentBuilds(bld_ref_time):
+                    if not put({ac_project: {plan: builds}}):
+                        return
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                for i in range(workers):
+                    if not put(None):
+                        break
+
+        def reflectPlan(plan_builds):
+            plan_unrecorded, reflected = self._partitionBuilds(agicen_builds, plan_builds, recorded_numbers)
+            if not plan_unrecorded:
+                return
+            plan_unrecorded.sort(key=self._chronologicalOrder)
+            plan, build, ac_project = plan_unrecorded[-1]
+            with results_lock:
+                unrecorded_builds.extend(plan_unrecorded)
+                final_builds[plan.key] = build
+                definition_lock = definition_locks.setdefault((ac_project, plan.name), threading.Lock())
+            with definition_lock:
+                build_defns, existing_builds = self._prepareDefinitions(plan_unrecorded, stalled_plans)
+                if (ac_project, plan.name) not in build_defns:
+                    return
+                plan_outcomes = self._reflectDefinitionBuilds(plan_unrecorded, build_defns, existing_builds,
+                                                              preview_mode, final_builds, stalled_plans)
+            with results_lock:
+                outcomes.update(plan_outcomes)
+
+        def consume():
+            try:
+                while not stop.is_set():
+                    try:
+                        plan_builds = plan_queue.get(timeout=QUEUE_POLL_INTERVAL)
+                        if plan_builds is None:
+                            return
+                        reflectPlan(plan_builds)
+                    except queue.Empty:
+                        pass
+                    except Exception as msg:
+                        plan_keys = [plan.key for plans in plan_builds.values() for plan in plans]
+                        self.log.error('OperationalException reflecting builds of plan %s - %s' % (", ".join(plan_keys), msg))
+                        stalled_plans.update(plan_keys)
+            except BaseException:
+                stop.set()
+                raise
+
+        producer = threading.Thread(target=produce, name='plan-producer')
+        producer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                consumers = [pool.submit(consume) for i in range(workers)]
+            for consumer in consumers:
+                consumer.result()
+        finally:
+            stop.set()  # the producer must not be left waiting on a queue nobody reads
+            producer.join()
+        if failures:
+            raise failures[0]
+        return unrecorded_builds, outcomes
+
+    def _reflectDefinitionBuilds(self, builds, build_defns, existing_builds, preview_mode, final_builds, stalled_plans):
+        """
+            Reflect in Agile Central the builds (a chronologically ordered list of (plan, build, ac_project) tuples)
+            which all belong to the same BuildDefinition.
+            Returns a dict keyed by (plan key, build number) with a (Agile Central Build, status) tuple
+            for each build that was either posted or skipped as already recorded.
+        """
+        agicen = self.agicen_conn
+        bld    = self.bld_conn
+        outcomes = {}
+        batch_size = getattr(agicen, 'batch_size', 0)
+        pending = []  # (plan, build, info) of the builds prepared for the next batch create
+
+        for plan, build, ac_project in builds:
+            build_definition = build_defns[(ac_project, plan.name)]
+
+            if agicen.buildKey(build_definition, build.number) in existing_builds:
+                self.log.debug('Build #{0} for {1} already recorded, skipping...'.format(build.number, plan))
+                if not preview_mode:
+                    self._advanceWatermark(plan, build, final_builds, stalled_plans)
+                outcomes[(plan.key, build.number)] = (None, 'skipped')
+                continue
 
             try:
+                # revision/change details are fetched only for builds about to be posted
+                if self.show_vcs_data and hasattr(bld, 'expandVCSData'):
+                    bld.expandVCSData(build)
                 #changesets, build_definition = agicen.prepAgileCentralBuildPrerequisites(job, build, project)
                 changesets, build_definition = agicen.prepAgileCentralBuildPrerequisites(plan, build, ac_project)
             except Exception as msg:
                 self.log.error('OperationalException prepACBuildPrerequisites - %s' % msg)
+                stalled_plans.add(plan.key)
+                continue
+
+            if batch_size > 1:
+                pending.append((plan, build, self._buildInfo(build_definition, build, changesets)))
+                if len(pending) >= batch_size:
+                    self._postPendingBuilds(pending, preview_mode, final_builds, stalled_plans, outcomes)
+                    pending = []
                 continue
 
             try:
                 #agicen_build, status = self.postBuildToAgileCentral(build_definition, build, changesets, job)
-                agicen_build, status = self.postBuildToAgileCentral(build_definition, build, changesets, plan)
+                agicen_build, build_status = self.postBuildToAgileCentral(build_definition, build, changesets, plan)
             except Exception as msg:
                 self.log.error('OperationalException postingACBuild - %s' % msg)
+                stalled_plans.add(plan.key)
                 continue
 
-            if agicen_build and status == 'posted':
-                builds_posted[plan] += 1
-                if plan not in recorded_builds:
-                    recorded_builds[plan] = []
-                recorded_builds[plan].append(agicen_build)
-            status = True
+            if not preview_mode:
+                self._advanceWatermark(plan, build, final_builds, stalled_plans)
+            outcomes[(plan.key, build.number)] = (agicen_build, build_status)
 
-        return status, recorded_builds
+        if pending:
+            self._postPendingBuilds(pending, preview_mode, final_builds, stalled_plans, outcomes)
+
+        # a stalled plan never gets to its final build, keep the progress made up to the stall
+        if not preview_mode and any(plan.key in stalled_plans for plan, build, ac_project in builds):
+            self._writeWatermarks()
+        return outcomes
+
+    def _advanceWatermark(self, plan, build, final_builds, stalled_plans):
+        """
+            Raise the watermark of the plan to the build just reflected in Agile Central,
+            unless an earlier build of the plan failed to be reflected (or this one is still running),
+            in which case the watermark stays put so the failed build gets picked up on the next run.
+        """
+        if not build.finished:
+            stalled_plans.add(plan.key)
+        if plan.key in stalled_plans:
+            return
+        number = build.number
+        if hasattr(self.bld_conn, 'settledNumber'):  # not past a lower numbered build that hasn't finished yet
+            number = self.bld_conn.settledNumber(plan.key, number)
+        with self.watermark_lock:  # the builds of different plans are reflected concurrently
+            self.watermark_file.record(plan.key, number, build.timestamp)
+        if final_builds[plan.key] is build:
+            self._writeWatermarks()
+
+    def _writeWatermarks(self):
+        with self.watermark_lock:
+            try:
+                self.watermark_file.write()
+            except Exception as msg:
+                self.log.error("Unable to write the watermark file %s: %s" % (self.watermark_file.filename, msg))
 
     def postBuildToAgileCentral(self, build_defn, build, changesets, plan):
         desc = '%s %s #%s | %s | %s  not yet reflected in Agile Central'
         # add that "collection" as the Build's Changesets collection                                                                 bts = time.strftime("%Y-%m-%d %H:%M:%S Z", time.gmtime(build.timestamp / 1000.0))
         # self.log.debug(desc % (pm_tag, job, build.number, build.result, bts))
+        info = self._buildInfo(build_defn, build, changesets)
+        # builds already recorded in Agile Central have been weeded out by reflectBuildsInAgileCentral
+        agicen_build = self.agicen_conn.createBuild(info)
+        return agicen_build, 'posted'
+
+    def _buildInfo(self, build_defn, build, changesets):
         build_data = build.as_tuple_data()
         info = OrderedDict(build_data)
         info['BuildDefinition'] = build_defn
         if changesets:
             info['Changesets'] = changesets
-        existing_agicen_build = self.agicen_conn.buildExists(build_defn, build.number)
-        if existing_agicen_build:
-            self.log.debug('Build #{0} for {1} already recorded, skipping...'.format(build.number, plan))
-            return existing_agicen_build, 'skipped'
-        agicen_build = self.agicen_conn.createBuild(info)
-        return agicen_build, 'posted'
+        return info
+
+    def _postPendingBuilds(self, pending, preview_mode, final_builds, stalled_plans, outcomes):
+        """
+            Create the Agile Central Builds for the pending (plan, build, info) tuples with as few
+            requests as the Agile Central connection can manage, then account for each as
+            _reflectDefinitionBuilds does for a build posted on its own.
+        """
+        agicen_builds = self.agicen_conn.createBuilds([info for plan, build, info in pending])
+        for (plan, build, info), agicen_build in zip(pending, agicen_builds):
+            if isinstance(agicen_build, Exception):
+                self.log.error('OperationalException postingACBuild - %s' % agicen_build)
+                stalled_plans.add(plan.key)
+                continue
+            if not preview_mode:
+                self._advanceWatermark(plan, build, final_builds, stalled_plans)
+            outcomes[(plan.key, build.number)] = (agicen_build, 'posted')
 
     def getRefTimes(self, secs_last_run):
         """
@@ -320,9 +721,6 @@ class BLDConnector:
             If there are items in the agicen_builds for which there is no counterpart in 
             the bld_builds, information has been lost,  dat would be some bad... --> ERROR
         """
-        reflected_builds   = []
-        unrecorded_builds  = []
-
         # for view_and_project, jobs in bld_builds.items():
         #     view, project = view_and_project.split('::', 1)
         #     for job, builds in jobs.items():
@@ -339,22 +737,52 @@ class BLDConnector:
         #                         continue
         #             unrecorded_builds.append((job, build, project, view))
 
+        unrecorded_builds, reflected_builds = self._partitionBuilds(agicen_builds, bld_builds)
+        self.log.debug("%d recent builds already reflected in Agile Central" % len(reflected_builds))
+        return unrecorded_builds
+
+
+    def _indexAgileCentralBuilds(self, agicen_builds):
+        """
+            Return a dict keyed by (AgileCentral project, BuildDefinition name) whose values are
+            the set of Build numbers recorded for that BuildDefinition in the agicen_builds.
+            A Build whose Number isn't numeric (posted by some other tool) can't match a build and is left out.
+        """
+        index = {}
+        for ac_project, plan_builds in agicen_builds.items():
+            for plan_name, builds in plan_builds.items():
+                numbers = index.setdefault((ac_project, plan_name), set())
+                for bld in builds:  #bld is a pyral build
+                    try:
+                        numbers.add(int(bld.Number))
+                    except (TypeError, ValueError):
+                        self.log.debug("Build %s of %s has a non-numeric Number, ignoring it" % (bld.Number, plan_name))
+        return index
+
+
+    def _partitionBuilds(self, agicen_builds, bld_builds, recorded_numbers=None):
+        """
+            Sort the bld_builds into those with no counterpart in the agicen_builds and those
+            with one, in a single pass over the bld_builds.  Each is a list of (plan, build, ac_project) tuples.
+            A caller partitioning several bld_builds against the same agicen_builds passes in
+            their _indexAgileCentralBuilds as recorded_numbers so it is only built once.
+        """
+        reflected_builds  = []
+        unrecorded_builds = []
+        no_numbers = frozenset()
+
+        if recorded_numbers is None:
+            recorded_numbers = self._indexAgileCentralBuilds(agicen_builds)
         for ac_project, bld_data in bld_builds.items():
             for plan, builds in bld_data.items():
+                numbers = recorded_numbers.get((ac_project, plan.name), no_numbers)
                 for build in builds:
-                    # look first for a matching project key in agicen_builds
-                    if ac_project in agicen_builds:
-                        plan_builds = agicen_builds[ac_project]
-                        # now look for a matching job in job_builds
-                        plan_name = plan.name
-                        if plan_name in plan_builds:
-                            ac_build_nums = [int(bld.Number) for bld in plan_builds[plan_name]] #bld is a pyral build
-                            if build.number in ac_build_nums:
-                                reflected_builds.append((plan, build, ac_project))
-                                continue
-                    unrecorded_builds.append((plan, build, ac_project))
-                    
-        return unrecorded_builds
+                    if build.number in numbers:
+                        reflected_builds.append((plan, build, ac_project))
+                    else:
+                        unrecorded_builds.append((plan, build, ac_project))
+
+        return unrecorded_builds, reflected_builds
 
 
     # def dumpChangesetInfo(self, builds):
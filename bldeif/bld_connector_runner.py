@@ -11,6 +11,9 @@ import sys, os
 import re
 import time
 import glob
+import random
+import signal
+import threading
 from calendar import timegm
 
 from bldeif.utils.klog       import ActivityLogger
@@ -44,6 +47,8 @@ STD_TS_FMT = '%Y-%m-%d %H:%M:%S Z'
 
 THREE_DAYS = 3 * 86400
 
+DEFAULT_DAEMON_INTERVAL = 300  # seconds between the polls of a --daemon
+
 time_helper = TimeHelper()
 
 ############################################################################################################
@@ -86,6 +91,15 @@ class BuildConnectorRunner(object):
         clear_text_creds = [opt for opt in options if opt in ['-c', '--c'] or opt.startswith('--cleartext')]
         if clear_text_creds:
             self.cleartext_flag = True
+
+        # --daemon keeps polling every --interval=<seconds>, give or take up to --jitter=<seconds>
+        self.daemon   = '--daemon' in options
+        self.interval = self._numericOption(options, '--interval=', DEFAULT_DAEMON_INTERVAL)
+        self.jitter   = self._numericOption(options, '--jitter=', self.interval // 10)
+        self.stop_requested = threading.Event()
+        self.sleep = self.stop_requested.wait  # waits out the delay between polls, returns early on a stop request
+        self.connectors = {}  # in daemon mode, config name : (config mtime, BLDConnector, preview) kept between polls
+        self.loggers    = {}  # in daemon mode, log file name : ActivityLogger kept between polls
         self.config_file_names = args
 
         if self.default_log_file_name:  # set it to first config file minus any '_config.yml' portion
@@ -104,6 +118,14 @@ class BuildConnectorRunner(object):
         self.connector = None
         self.extension = {}
 
+    def _numericOption(self, options, prefix, default):
+        spec = [opt for opt in options if opt.startswith(prefix)]
+        if not spec:
+            return default
+        try:
+            return max(0, int(spec[0].replace(prefix, '')))
+        except ValueError:
+            raise ConfigurationError("The %s<seconds> option requires an integer value" % prefix)
 
     def proclaim_existence(self, build_system_name):
         proc = ProcTable.targetProcess(os.getpid())
@@ -146,14 +168,11 @@ class BuildConnectorRunner(object):
         own_lock = self.acquireLock()
 
         try:
-            for config_file in self.config_file_names:
-                config_file_path = self.find_config_file(config_file)
-                if not config_file_path:
-                    raise ConfigurationError("No config file for '%s' found in the config subdir" % config_file)
-                lf_name = "logs/%s.log" % config_file.replace('.yml', '').replace('_config', '')
-                self.log = ActivityLogger(lf_name)
-                logAllExceptions(True, self.log)
-                self._operateService(config_file_path)
+            if self.daemon:
+                self.runDaemon()
+            else:
+                for config_file in self.config_file_names:
+                    self._serviceConfig(config_file)
         except Exception as msg:
             self.log.error(msg)
         finally:
@@ -163,6 +182,92 @@ class BuildConnectorRunner(object):
                 raise OperationalError("ERROR: unable to remove lock file '%s', %s" % (LOCK_FILE, msg))
         self.log.info('run completed')
 
+    def _serviceConfig(self, config_file):
+        config_file_path = self.find_config_file(config_file)
+        if not config_file_path:
+            raise ConfigurationError("No config file for '%s' found in the config subdir" % config_file)
+        lf_name = "logs/%s.log" % config_file.replace('.yml', '').replace('_config', '')
+        if not self.daemon:
+            self.log = ActivityLogger(lf_name)
+        else:
+            if lf_name not in self.loggers:
+                self.loggers[lf_name] = ActivityLogger(lf_name)
+            self.log = self.loggers[lf_name]
+        logAllExceptions(True, self.log)
+        self._operateService(config_file_path)
+
+    def runDaemon(self):
+        """
+            Poll on behalf of each config every self.interval seconds (give or take up to self.jitter seconds)
+            until a SIGTERM or SIGINT is received.  The connector for a config, with its connections and caches,
+            is kept from one poll to the next unless the config file is modified or the poll fails.
+            The lock is held for as long as the daemon runs.
+        """
+        def requestStop(signum, frame):
+            self.log.info("Received signal %d, stopping after the current poll" % signum)
+            self.stop_requested.set()
+
+        previous_handlers = {signum: signal.signal(signum, requestStop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        self.log.info("Daemon mode, polling every %d seconds (+/- %d seconds)" % (self.interval, self.jitter))
+        try:
+            while not self.stop_requested.is_set():
+                for config_file in self.config_file_names:
+                    if self.stop_requested.is_set():
+                        break
+                    try:
+                        self._serviceConfig(config_file)
+                    except Exception as msg:
+                        # the next poll starts from scratch for this config
+                        self.log.error(msg)
+                        if config_file in self.connectors:
+                            self.disconnectConnector(self.connectors.pop(config_file)[1])
+                if not self.stop_requested.is_set():
+                    self.sleep(self.pollDelay())
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            for mtime, connector, preview in self.connectors.values():
+                self.disconnectConnector(connector)
+            self.connectors = {}
+        self.log.info("Daemon stopped")
+
+    def pollDelay(self):
+        """
+            Return the seconds to wait before the next poll, self.interval give or take up to self.jitter seconds
+            so that daemons started together don't keep polling in lockstep.
+        """
+        return max(0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    def disconnectConnector(self, connector):
+        for conn in (connector.agicen_conn, connector.bld_conn):
+            if conn is None:
+                continue
+            try:
+                conn.disconnect()
+            except Exception as msg:
+                self.log.warning("Problem disconnecting %s: %s" % (conn.__class__.__name__, msg))
+
+    def obtainConnector(self, config_name, config_file_path):
+        """
+            Return a BLDConnector for the config.  In daemon mode the connector obtained on an
+            earlier poll is reused, unless the config file has been modified since then.
+        """
+        config_mtime = os.path.getmtime(config_file_path)
+        if self.daemon and config_name in self.connectors:
+            mtime, connector, preview = self.connectors[config_name]
+            if mtime == config_mtime:
+                self.preview = preview
+                return connector
+            self.log.info("%s has been modified, reloading it" % config_file_path)
+            del self.connectors[config_name]
+            self.disconnectConnector(connector)
+
+        config = self.getConfiguration(config_name)
+        connector = BLDConnector(config, self.log)
+        if self.daemon:
+            self.connectors[config_name] = (config_mtime, connector, self.preview)
+        return connector
+
     def identifyBuildSystemName(self):
         file_name = self.find_config_file(self.first_config)
         if not file_name:
@@ -210,7 +315,6 @@ class BuildConnectorRunner(object):
         last_conf_mod = time.strftime(STD_TS_FMT, time.gmtime(os.path.getmtime(config_file_path)))
         conf_file_size = os.path.getsize(config_file_path)
         self.log.info("%s last modified %s,  size: %d chars" % (config_file_path, last_conf_mod, conf_file_size))
-        config = self.getConfiguration(config_name)
 
         secs_this_run   = time.time()     # be optimistic that the reflectBuildsInAgileCentral service will succeed
         zulu_str_this_run = time_helper.stringFromSeconds(secs_this_run, STD_TS_FMT)
@@ -225,7 +329,7 @@ class BuildConnectorRunner(object):
 
         self.log.info("Time File value %s --- Now %s" % (zulu_str_last_run, zulu_str_this_run))
 
-        self.connector = BLDConnector(config, self.log)
+        self.connector = self.obtainConnector(config_name, config_file_path)
         self.log.debug("Got a BLDConnector instance, calling the BLDConnector.run ...")
         status, builds = self.connector.run(secs_last_run, self.extension)
         # builds is an OrderedDict instance, keyed by job name, value is a list of Build instances
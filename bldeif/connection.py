@@ -114,6 +114,19 @@ class BLDConnection(object):
         return modified_artifact
 
 
+    def createBuilds(self, int_work_items):
+        """
+            The counterpart of createBuild for a list of items, for connections able to create
+            several items per request.  Like createBuild, this should never be overridden.
+            Returns a list parallel to int_work_items holding either the created artifact
+            or the Exception that prevented its creation.
+        """
+        modified_int_work_items = [self.preCreate(int_work_item) for int_work_item in int_work_items]
+        work_items = self._createInternalBatch(modified_int_work_items)
+        return [work_item if isinstance(work_item, Exception) else self.postCreate(work_item)
+                for work_item in work_items]
+
+
     def preCreate(self, int_work_item):
         """
             Usually will be overridden by those who extend our existing connection 
@@ -132,6 +145,20 @@ class BLDConnection(object):
         raise NotImplementedError(problem)
 
 
+    def _createInternalBatch(self, int_work_items):
+        """
+            Subclasses able to create several items with one request override this method,
+            by default the items are created one at a time with _createInternal.
+        """
+        work_items = []
+        for int_work_item in int_work_items:
+            try:
+                work_items.append(self._createInternal(int_work_item))
+            except Exception as exc:
+                work_items.append(exc)
+        return work_items
+
+
     def postCreate(self, artifact):
         """
             Usually will be overridden by those who extend our existing connection 
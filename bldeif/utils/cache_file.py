@@ -0,0 +1,68 @@
+
+#############################################################################################
+
+import os
+import json
+import time
+
+from bldeif.utils.json_file import writeJSONFile
+
+#############################################################################################
+
+# Persist some content (anything JSON serializable) between runs of the connector.
+# Along with the content, the time it was written and a caller supplied fingerprint are kept.
+# The content is considered stale once it is older than the time-to-live or when the fingerprint
+# supplied on reading doesn't match the one it was written with (eg, the config file has changed).
+
+#############################################################################################
+
+class CacheFile(object):
+    """
+        An instance of this class reads and (atomically) writes a JSON cache file
+        whose content expires after ttl seconds (a ttl of None means it never expires).
+    """
+
+    def __init__(self, filename, logger, ttl=None):
+        self.filename = filename
+        self.log      = logger
+        self.ttl      = ttl
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def read(self, fingerprint=None):
+        """
+            Return the cached content or None if there is no cache file, the content has expired,
+            the fingerprint doesn't match or the file can't be read.
+        """
+        if not self.exists():
+            return None
+        try:
+            with open(self.filename, "r") as f:
+                cached = json.load(f)
+            written = cached['written']
+            content = cached['content']
+        except Exception as msg:
+            self.log.warning("Unable to read cache file %s, ignoring it: %s" % (self.filename, msg))
+            return None
+        if self.ttl is not None and time.time() - written > self.ttl:
+            self.log.debug("Cache file %s has expired" % self.filename)
+            return None
+        if cached.get('fingerprint') != fingerprint:
+            self.log.debug("Cache file %s is out of date" % self.filename)
+            return None
+        return content
+
+    def write(self, content, fingerprint=None):
+        cached = {'written': int(time.time()), 'fingerprint': fingerprint, 'content': content}
+        writeJSONFile(self.filename, cached)
+
+    def invalidate(self):
+        """
+            Remove the cache file so the next read comes up empty.
+        """
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
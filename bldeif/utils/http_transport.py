@@ -0,0 +1,83 @@
+
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+#############################################################################################
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+#############################################################################################
+
+class HTTPTransport(object):
+    """
+        An instance of this class holds a requests.Session whose connections are pooled
+        and kept alive, so that successive requests to the same server don't pay for
+        a new TCP (and TLS) handshake every time.
+        Requests time out per the connect/read timeouts and those failing with a
+        status in RETRY_STATUS_CODES (or a connection error) are retried with exponential backoff.
+        The latency of every request is recorded.
+    """
+
+    def __init__(self, logger, auth=None, proxies=None, headers=None, pool_size=10,
+                       connect_timeout=10, read_timeout=60, retries=3, backoff=0.5):
+        self.log     = logger
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry_policy = Retry(total=retries, connect=retries, read=retries, status=retries,
+                             backoff_factor=backoff,
+                             status_forcelist=RETRY_STATUS_CODES,
+                             raise_on_status=False)  # hand back the last response, callers check status_code
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry_policy)
+
+        self.session = requests.Session()
+        self.session.mount('http://',  adapter)
+        self.session.mount('https://', adapter)
+        self.session.auth = auth
+        if proxies:
+            self.session.proxies.update(proxies)
+        if headers:
+            self.session.headers.update(headers)
+
+        self.latency_lock = threading.Lock()
+        self.request_count = 0
+        self.total_latency = 0.0
+        self.max_latency   = 0.0
+
+    def get(self, url, **kwargs):
+        """
+            Issue a GET for the url using a pooled connection and return the response.
+            The elapsed time (up to receipt of the response headers when stream=True is given)
+            is added to the latency statistics.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        started  = time.time()
+        response = self.session.get(url, **kwargs)
+        elapsed  = time.time() - started
+        self.recordLatency(elapsed)
+        self.log.debug("GET %s  status_code: %s  %6.3f secs" % (url, response.status_code, elapsed))
+        return response
+
+    def recordLatency(self, elapsed):
+        with self.latency_lock:
+            self.request_count += 1
+            self.total_latency += elapsed
+            self.max_latency    = max(self.max_latency, elapsed)
+
+    def latencySummary(self):
+        """
+            Return a human readable synopsis of the latencies recorded so far.
+        """
+        with self.latency_lock:
+            if not self.request_count:
+                return "no requests issued"
+            average = self.total_latency / self.request_count
+            return "%d requests, %6.3f secs total, %6.3f secs average, %6.3f secs max" % \
+                   (self.request_count, self.total_latency, average, self.max_latency)
+
+    def close(self):
+        self.session.close()
+
@@ -0,0 +1,26 @@
+
+#############################################################################################
+
+import os
+import json
+import tempfile
+
+#############################################################################################
+
+# Write the state files kept between runs of the connector (watermarks, caches) atomically:
+# the JSON content goes to a temp file in the same directory which is then renamed over the
+# original, so that an interrupted run can't leave a truncated file behind.
+
+#############################################################################################
+
+def writeJSONFile(filename, content):
+    dir_name = os.path.dirname(filename) or '.'
+    fd, tmp_name = tempfile.mkstemp(dir=dir_name, prefix='.%s' % os.path.basename(filename))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f, indent=1, sort_keys=True)
+        os.replace(tmp_name, filename)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
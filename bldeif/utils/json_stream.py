@@ -0,0 +1,123 @@
+
+#############################################################################################
+
+import codecs
+import json
+
+#############################################################################################
+
+# Incrementally decode the elements of one array nested in a JSON document (identified by the
+# sequence of object keys leading to it) from an iterable of byte chunks, eg. the iter_content of a
+# streamed requests response.  Only one element at a time (plus the current chunk) is held in memory,
+# the remainder of the document past the array is never read.
+#
+#    for record in iterJSONArray(response.iter_content(chunk_size=65536), ('results', 'result')):
+#        ...
+
+WHITESPACE = ' \t\n\r'
+
+#############################################################################################
+
+class JSONStreamError(Exception):
+    pass
+
+#############################################################################################
+
+def iterJSONArray(chunks, path):
+    """
+        Generator of the decoded elements of the array located at path (a sequence of keys)
+        within the JSON document streamed in by chunks.  Yields nothing if the path doesn't exist.
+    """
+    return JSONArrayStream(chunks).items(path)
+
+#############################################################################################
+
+class JSONArrayStream(object):
+
+    def __init__(self, chunks):
+        self.chunks  = iter(chunks)
+        self.utf8    = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buffer  = ''
+        self.pos     = 0
+        self.eof     = False
+
+    def items(self, path):
+        for key in path:
+            if not self._findKey(key):
+                return
+        self._expect('[')
+        if self._peek() == ']':
+            return
+        while True:
+            yield self._value()
+            if self._next() == ']':
+                return
+
+    def _findKey(self, key):
+        """
+            Positions the stream at the value of key within the object that starts at the current position.
+            Returns False if the object has no such key.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            return False
+        while True:
+            member = self._value()
+            self._expect(':')
+            if member == key:
+                return True
+            self._value()  # not the member of interest, decode it and forget it
+            if self._next() == '}':
+                return False
+
+    def _fill(self):
+        """
+            Append the next chunk to what remains unconsumed of the buffer.
+            Returns False when there are no more chunks.
+        """
+        if self.eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            chunk = b''
+        text = self.utf8.decode(chunk, final=self.eof)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return not self.eof or bool(text)
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise JSONStreamError("Unexpected end of JSON content")
+
+    def _next(self):
+        char = self._peek()
+        self.pos += 1
+        return char
+
+    def _expect(self, char):
+        found = self._next()
+        if found != char:
+            raise JSONStreamError("Expected '%s' but found '%s' in JSON content" % (char, found))
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number (or literal) ending right at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as msg:
+                if self.eof:
+                    raise JSONStreamError("Invalid JSON content: %s" % msg)
+            self._fill()
+
@@ -55,6 +55,7 @@ import time
 import re
 import string
 import stat
+import threading
 
 DEFAULT_FORMAT_STR = "[%(time)s] %(level)5.5s: %(caller)s - %(msg)s"
 
@@ -248,6 +249,7 @@ class ActivityLogger(object):
         self.rotate = rotate
         self.current_level = self.level_value['INFO']
         self.message_count = 0
+        self.sink_lock = threading.RLock()  # connections may log from worker threads
         if self.rotate:
             self.rotator = LogFileRotator(file_name, policy, limit, frequency, self)
 
@@ -270,10 +272,11 @@ class ActivityLogger(object):
 ##              (self.level_value[level], self.current_level))
 ##
         if self.level_value[level] >= self.current_level:
-            self.sink.log(msg, level, exception_triggered=exception_triggered)
-  
-            if self.rotate and self.sink.rotationEligible(): # no rotation possible with stdout...
-                self.rotator.rotateLogPerPolicy()
+            with self.sink_lock:
+                self.sink.log(msg, level, exception_triggered=exception_triggered)
+
+                if self.rotate and self.sink.rotationEligible(): # no rotation possible with stdout...
+                    self.rotator.rotateLogPerPolicy()
 
     def _augment(self, original):
         """
@@ -314,11 +317,12 @@ class ActivityLogger(object):
         self.log(msg, 'FATAL', exception_triggered=exception_triggered)
 
     def write(self, msg, level=None):
-      if not level or level not in ActivityLogger.valid_levels:
-          self.sink.write(msg)
-      else:
-          if self.level_value[level] >= self.current_level:
+      with self.sink_lock:
+          if not level or level not in ActivityLogger.valid_levels:
               self.sink.write(msg)
+          else:
+              if self.level_value[level] >= self.current_level:
+                  self.sink.write(msg)
 
 #########################################################################################
 
@@ -1,15 +1,74 @@
 import time
 import calendar
 import re
+from functools import lru_cache
+
+# Bamboo timestamps look like '2017-06-12T13:55:39.712-06:00', Agile Central ones like '2017-06-12T19:55:39.712Z'
+ISO8601_PATTERN = re.compile(r'^(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.\d+)?\s*(?:(Z)|([+-])(\d\d):?(\d\d))$')
+
+TIMESTAMP_MEMO_SIZE = 8192
+
+def daysFromCivil(year, month, day):
+    """
+        Number of days from 1970-01-01 to the given proleptic Gregorian date
+        (http://howardhinnant.github.io/date_algorithms.html#days_from_civil)
+    """
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def isoSeconds(time_str):
+    """
+        Return the UTC epoch seconds for an ISO-8601 timestamp with a Z or +/-HH:MM offset
+        (fractional seconds are dropped) or None if time_str is not in that shape.
+    """
+    mo = ISO8601_PATTERN.match(time_str)
+    if not mo:
+        return None
+    year, month, day, hour, minute, second, zulu, sign, off_hour, off_min = mo.groups()
+    secs = daysFromCivil(int(year), int(month), int(day)) * 86400 + int(hour) * 3600 + int(minute) * 60 + int(second)
+    if not zulu:
+        offset = int(off_hour) * 3600 + int(off_min) * 60
+        secs += -offset if sign == '+' else offset
+    return secs
 
 class TimeHelper:
     def secondsFromString(self, time_str):
-        tz_offset_with_colon = re.compile(r'.\d+-\d\d:\d\d$')
+        """
+            Return the UTC epoch seconds (an int) for time_str.
+            Results are memoized, as the same timestamps tend to be converted over and over.
+        """
+        return self._memoizedSeconds(time_str)
+
+    def secondsFromStrings(self, time_strs):
+        """
+            Batch version of secondsFromString, returns a list of epoch seconds values
+        """
+        memoized = self._memoizedSeconds
+        return [memoized(time_str) for time_str in time_strs]
+
+    @staticmethod
+    @lru_cache(maxsize=TIMESTAMP_MEMO_SIZE)
+    def _memoizedSeconds(time_str):
+        secs = isoSeconds(time_str)
+        if secs is None:
+            secs = TimeHelper().strptimeSecondsFromString(time_str)
+        return secs
+
+    def strptimeSecondsFromString(self, time_str):
+        """
+            The general (and slow) path for converting time_str to UTC epoch seconds
+            by trying a sequence of time.strptime formats
+        """
+        tz_offset_with_colon = re.compile(r'.\d+[-+]\d\d:\d\d$')
         if tz_offset_with_colon.search(time_str):
             time_str = self.popLastColon(time_str)
         struct = self.parseTimeStringToStruct(time_str)
-        secs = int(time.mktime(struct))
-        return secs
+        secs = calendar.timegm(struct) - (struct.tm_gmtoff or 0)
+        return int(secs)
 
     def secondsFromStruct(self, struct):
         return calendar.timegm(struct)
@@ -0,0 +1,67 @@
+
+#############################################################################################
+
+import os
+import json
+
+from bldeif.utils.json_file import writeJSONFile
+
+#############################################################################################
+
+# Store the build number up to which every build of a plan has been reflected in Agile Central
+# (and the completion time of the latest build reflected), so that a later run need only ask the
+# build system for builds above that number.
+# The file content is a JSON object keyed by plan key:
+#     {"FER-DON": {"number": 74, "timestamp": 1497297339}, ...}
+
+#############################################################################################
+
+class WatermarkFile(object):
+    """
+        An instance of this class is used to record per-plan watermarks in a file.
+        The file is always rewritten atomically (see writeJSONFile) so that an interrupted
+        run can't leave it truncated.
+    """
+
+    def __init__(self, filename, logger):
+        self.filename   = filename
+        self.log        = logger
+        self.watermarks = {}
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def read(self):
+        """
+            Return a dict keyed by plan key whose values are dicts with 'number' and 'timestamp' keys.
+            An absent or unreadable file results in an empty dict (ie, no watermarks).
+        """
+        self.watermarks = {}
+        if not self.exists():
+            return self.watermarks
+        try:
+            with open(self.filename, "r") as f:
+                content = json.load(f)
+            self.watermarks = {key: {'number': int(mark['number']), 'timestamp': int(mark['timestamp'])}
+                               for key, mark in content.items()}
+        except Exception as msg:
+            self.log.error("Could not read watermarks from %s, ignoring its content: %s" % (self.filename, msg))
+            self.watermarks = {}
+        return self.watermarks
+
+    def get(self, key):
+        """
+            Return the highest recorded build number for the plan key, or 0 if there is none.
+        """
+        return self.watermarks.get(key, {}).get('number', 0)
+
+    def record(self, key, number, timestamp):
+        """
+            Raise the watermark for the plan key to number (a lower number never lowers it).
+        """
+        if number > self.get(key):
+            self.watermarks[key] = {'number': int(number), 'timestamp': int(timestamp)}
+
+    def write(self):
+        writeJSONFile(self.filename, self.watermarks)
+
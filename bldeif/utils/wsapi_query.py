@@ -0,0 +1,101 @@
+
+#############################################################################################
+
+# Construct Agile Central WSAPI query strings that select the items whose field has any one of
+# a set of values.  WSAPI only understands binary expressions, "(x) OR (y)", so the OR'ed conditions
+# are arranged in a balanced tree (nesting depth grows with log2 of the number of values rather
+# than with the number of values) and a large set of values is split over several queries, each
+# small enough to keep the request URL well within what the server accepts.
+#
+#    orQuery('Name', ['A', 'B', 'C'])  -->  ((Name = "A") OR ((Name = "B") OR (Name = "C")))
+
+MAX_QUERY_TERMS  = 50    # max number of values mentioned in a single query
+MAX_QUERY_LENGTH = 3000  # max number of characters of the OR'ed conditions in a single query
+
+#############################################################################################
+
+def condition(field, value, quoted=True):
+    if quoted:
+        return '(%s = "%s")' % (field, value)
+    return '(%s = %s)' % (field, value)
+
+def _enclosed(expression):
+    """
+        Return True when the opening paren at the start of the expression is matched by the closing paren
+        at its end, which isn't so for '(A) OR (B)'.  Parens within double quoted values don't count.
+    """
+    if not (expression.startswith('(') and expression.endswith(')')):
+        return False
+    depth, quoted = 0, False
+    for ix, char in enumerate(expression):
+        if char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return ix == len(expression) - 1
+    return False
+
+def parenthesized(expression):
+    """
+        expression is either a simple condition (eg, 'Number = 3') or an already parenthesized one
+    """
+    if _enclosed(expression):
+        return expression
+    return '(%s)' % expression
+
+def _balanced(conditions, conjunction):
+    if len(conditions) == 1:
+        return conditions[0]
+    middle = len(conditions) // 2
+    return '(%s %s %s)' % (_balanced(conditions[:middle], conjunction), conjunction,
+                           _balanced(conditions[middle:], conjunction))
+
+def orQuery(field, values, quoted=True):
+    """
+        Return the query selecting items whose field has any of the values, or None if there are no values.
+    """
+    conditions = [condition(field, value, quoted) for value in values]
+    if not conditions:
+        return None
+    return _balanced(conditions, 'OR')
+
+def andQuery(*expressions):
+    """
+        Return the query selecting items satisfying all of the expressions (None's are disregarded).
+    """
+    conditions = [parenthesized(expression) for expression in expressions if expression]
+    if not conditions:
+        return None
+    return _balanced(conditions, 'AND')
+
+def chunkValues(field, values, quoted=True, max_terms=MAX_QUERY_TERMS, max_length=MAX_QUERY_LENGTH):
+    """
+        Split the (de-duplicated) values into lists, each of which results in an orQuery
+        of no more than max_terms conditions and (roughly) max_length characters.
+    """
+    chunks = []
+    chunk, length = [], 0
+    for value in sorted(set(values), key=str):
+        term_length = len(condition(field, value, quoted)) + 6  # for the ' OR ' and the enclosing parens
+        if chunk and (len(chunk) >= max_terms or length + term_length > max_length):
+            chunks.append(chunk)
+            chunk, length = [], 0
+        chunk.append(value)
+        length += term_length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def orQueries(field, values, criteria=None, quoted=True, max_terms=MAX_QUERY_TERMS, max_length=MAX_QUERY_LENGTH):
+    """
+        Return the list of queries which together select the items whose field has any of the values
+        (and which also satisfy the criteria, if given).
+    """
+    return [andQuery(criteria, orQuery(field, chunk, quoted))
+            for chunk in chunkValues(field, values, quoted, max_terms, max_length)]
+
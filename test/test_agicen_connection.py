@@ -0,0 +1,413 @@
+import re
+import json
+import time
+
+import requests
+
+import bldeif.agicen_bld_connection
+from bldeif.utils.klog            import ActivityLogger
+from bldeif.agicen_bld_connection import AgileCentralConnection, MockBuild
+
+logger = ActivityLogger('logs/test_agicen_connection.log')
+
+CONFIG = {'Server': 'rally1.rallydev.com', 'APIKey': 'xyz', 'Workspace': 'Alligator Tiers', 'Project': 'Jenkins'}
+
+REF_TIME = time.gmtime(1498262400)  # 2017-06-24T00:00:00Z
+
+
+class WSAPIResponse(list):
+    errors   = []
+    warnings = []
+    @property
+    def resultCount(self):
+        return len(self)
+
+class BatchResponse:
+    def __init__(self, status_code, document=None):
+        self.status_code = status_code
+        self.document    = document
+    def json(self):
+        return self.document
+
+class Session:
+    """
+        Answers every batch request with the response it was given, keeping the requests it got
+    """
+    def __init__(self, response):
+        self.response = response
+        self.posts    = []
+    def post(self, url, data=None, timeout=None):
+        self.posts.append((url, json.loads(data), timeout))
+        return self.response
+
+class Rally:
+    """
+        Stands in for a pyral Rally instance, get answers with the items listed for the entity
+    """
+    service_url = 'https://rally1.rallydev.com/slm/webservice/v2.0'
+
+    def __init__(self, items, session=None):
+        self.items   = items
+        self.queries = []
+        self.created = []
+        self.creations = []  # the entity of each of the created items
+        self.session = session
+    def get(self, entity, query=None, **kwargs):
+        self.queries.append((entity, query))
+        return WSAPIResponse(self.items.get(entity, []))
+    def getProject(self, name):
+        return self.items.get('MEP', {}).get(name)
+    def obtainSecurityToken(self):
+        return None
+    def create(self, entity, item):
+        self.created.append(item)
+        self.creations.append(entity)
+        oid = 500 + len(self.created)
+        attributes = dict(item, ObjectID=oid, oid=oid, ref='%s/%d' % (entity.lower(), oid))
+        if entity == 'Build':
+            attributes['BuildDefinition'] = MockBuild({'Name': 'Plan 11', 'ObjectID': 11})
+        item = MockBuild(attributes)
+        self.items.setdefault(entity, []).append(item)
+        return item
+
+def build(defn_oid, number, project_oid=1001):
+    return MockBuild({'Number': number, 'ObjectID': 9000 + defn_oid, 'Status': 'SUCCESS', 'Start': '2017-06-24T10:00:00Z',
+                      'BuildDefinition': MockBuild({'Name': 'Plan %d' % defn_oid, 'ObjectID': defn_oid}),
+                      'Project': MockBuild({'Name': 'Jenkins', 'ObjectID': project_oid})})
+
+def build_definition(oid, project_oid):
+    return MockBuild({'Name': 'Plan %d' % oid, 'ObjectID': oid, 'ref': 'builddefinition/%d' % oid,
+                      'LastUpdateDate': '2017-06-24T00:00:00.000Z', 'Project': MockBuild({'ObjectID': project_oid})})
+
+def plan(name):
+    return MockBuild({'name': name, 'url': 'http://localhost:8085/browse/FER-DON', 'key': 'FER-DON'})
+
+def agicen_connection(items, session=None):
+    conn = AgileCentralConnection(CONFIG, logger)
+    conn.agicen = Rally(items, session)
+    return conn
+
+def work_item(number):
+    return {'Number': str(number), 'Status': 'SUCCESS', 'Start': '2017-06-24T10:00:00Z', 'Duration': 1.0,
+            'Uri': 'http://localhost:8085/browse/FER-DON-%d' % number, 'BuildDefinition': 'builddefinition/11'}
+
+def created(number):
+    return {'CreateResult': {'Errors': [], 'Object': {'_ref': 'build/%d' % (100 + number), 'ObjectID': 100 + number,
+                                                      'Number': str(number), 'Status': 'SUCCESS', 'Start': '2017-06-24T10:00:00Z',
+                                                      'BuildDefinition': {'_ref': 'builddefinition/11', 'ObjectID': 11,
+                                                                          '_refObjectName': 'Plan 11'}}}}
+
+def test_non_numeric_build_numbers_are_ignored():
+    conn = agicen_connection({'Build': [build(11, '7'), build(11, '1.2.3'), build(12, None)]})
+    builds = conn.getRecentBuilds(REF_TIME, ['Jenkins'])
+    assert len(builds['Jenkins']['Plan 11']) == 2
+    assert conn.recent_build_keys == {(11, 7)}
+
+def test_recorded_builds_skips_non_numeric_numbers():
+    conn = agicen_connection({'Build': [build(11, '5'), build(11, 'v5')]})
+    defn = MockBuild({'Name': 'Plan 11', 'ObjectID': 11})
+    recorded = conn.recordedBuilds([(defn, 5, 0), (defn, 6, 0)])
+    assert recorded == {(11, 5)}
+
+def test_repository_locks_are_per_repository():
+    conn = agicen_connection({})
+    assert conn.repositoryLock('git/Wombat') is conn.repositoryLock('git\\wombat')
+    assert conn.repositoryLock('git/Wombat') is not conn.repositoryLock('git/Koala')
+
+def test_batch_results_map_to_their_work_items():
+    rejected = {'CreateResult': {'Errors': ['Could not convert: Number'], 'Warnings': []}}
+    session = Session(BatchResponse(200, {'BatchResult': {'Errors': [], 'Results': [created(1), rejected, created(3)]}}))
+    conn = agicen_connection({}, session)
+    conn.batch_size = 3
+    builds = conn._createInternalBatch([work_item(1), work_item(2), work_item(3)])
+
+    assert [build.Number for build in builds] == ['1', '2', '3']
+    assert [build.ObjectID for build in (builds[0], builds[2])] == [101, 103]
+    assert builds[0].BuildDefinition.Name == 'Plan 11'
+    assert [item['Number'] for item in conn.agicen.created] == ['2']  # only the rejected one is created alone
+    url, batch, timeout = session.posts[0]
+    assert url.endswith('/batch')
+    assert len(batch['Batch']) == 3
+    assert timeout == (conn.connect_timeout, conn.read_timeout)
+
+def test_rejected_batch_falls_back_to_single_creates():
+    session = Session(BatchResponse(400))
+    conn = agicen_connection({}, session)
+    conn.batch_size = 2
+    builds = conn._createInternalBatch([work_item(1), work_item(2), work_item(3)])
+
+    assert [build.Number for build in builds] == ['1', '2', '3']
+    assert [item['Number'] for item in conn.agicen.created] == ['1', '2', '3']
+    assert len(session.posts) == 2  # a chunk of 2 and a chunk of 1
+    assert conn.agicen.queries == []  # nothing was created by a rejected batch, no need to look
+
+def test_failed_batch_creates_the_builds_it_did_not():
+    session = Session(BatchResponse(503))
+    conn = agicen_connection({}, session)
+    conn.batch_size = 3
+    builds = conn._createInternalBatch([work_item(1), work_item(2), work_item(3)])
+
+    assert [build.Number for build in builds] == ['1', '2', '3']
+    assert [item['Number'] for item in conn.agicen.created] == ['1', '2', '3']
+    assert [entity for entity, query in conn.agicen.queries] == ['Build']
+
+class TimedOutSession(Session):
+    """
+        Carries out the batch as far as creating the Builds numbered created_numbers, then times out
+    """
+    def __init__(self, rally, created_numbers):
+        super().__init__(None)
+        self.rally = rally
+        self.created_numbers = created_numbers
+    def post(self, url, data=None, timeout=None):
+        self.posts.append((url, json.loads(data), timeout))
+        self.rally.items.setdefault('Build', []).extend(build(11, str(number)) for number in self.created_numbers)
+        raise requests.exceptions.ReadTimeout("Read timed out. (read timeout=120.0)")
+
+def test_timed_out_batch_does_not_create_duplicates():
+    conn = agicen_connection({})
+    conn.agicen.session = TimedOutSession(conn.agicen, [1, 2])
+    conn.batch_size = 3
+    builds = conn._createInternalBatch([work_item(1), work_item(2), work_item(3)])
+
+    assert [build.Number for build in builds] == ['1', '2', '3']
+    assert [build.ObjectID for build in builds[:2]] == [9011, 9011]  # the Builds the batch did create
+    assert [item['Number'] for item in conn.agicen.created] == ['3']
+
+def test_batch_of_unknown_outcome_is_not_retried():
+    class Unreachable(Rally):
+        def get(self, entity, query=None, **kwargs):
+            raise requests.exceptions.ConnectionError("Connection reset by peer")
+    conn = agicen_connection({})
+    conn.agicen = Unreachable({})
+    conn.agicen.session = TimedOutSession(conn.agicen, [])
+    conn.batch_size = 2
+    builds = conn._createInternalBatch([work_item(1), work_item(2)])
+
+    assert all(isinstance(build, Exception) for build in builds)
+    assert conn.agicen.created == []
+
+def test_mep_project_builds_are_found_by_their_path():
+    # getProject gives the ObjectID as a string, query results give it as an int
+    mep = 'Jenkins // Salamandra'
+    conn = agicen_connection({'Project': [MockBuild({'Name': 'Jenkins', 'ObjectID': 1001, 'ref': 'project/1001'})],
+                              'MEP': {mep: MockBuild({'Name': 'Salamandra', 'ObjectID': '1002', 'ref': 'project/1002'})},
+                              'Build': [build(11, '7'), build(12, '8', project_oid=1002)]})
+    assert conn.validateProjects(['Jenkins', mep])
+    builds = conn.getRecentBuilds(REF_TIME, ['Jenkins', mep])
+    assert [b.Number for b in builds[mep]['Plan 12']] == ['8']
+    assert [b.Number for b in builds['Jenkins']['Plan 11']] == ['7']
+    assert len(conn.agicen.queries) == 2  # the projects and one workspace wide Build query
+
+def test_mep_project_build_definitions_are_warmed():
+    mep = 'Jenkins // Salamandra'
+    conn = agicen_connection({'Project': [MockBuild({'Name': 'Jenkins', 'ObjectID': 1001, 'ref': 'project/1001'})],
+                              'MEP': {mep: MockBuild({'Name': 'Salamandra', 'ObjectID': '1002', 'ref': 'project/1002'})},
+                              'BuildDefinition': [build_definition(12, '1002'), build_definition(11, 1001)]})
+    assert conn.validateProjects(['Jenkins', mep])
+    conn.warmBuildDefinitionCache(['Jenkins', mep])
+    assert conn.build_def[mep]['Plan 12'].ObjectID == 12
+    assert conn.build_def['Jenkins']['Plan 11'].ObjectID == 11
+
+
+class Changeset:
+    def __init__(self, commit_id, message):
+        self.commitId  = commit_id
+        self.message   = message
+        self.uri       = 'https://github.com/brescello/camillo/commit/%s' % commit_id
+        self.timestamp = 1498379400000
+        self.vcs       = 'git'
+
+class VCSBuild:
+    def __init__(self, changesets, repository='brescello/camillo'):
+        self.changeSets = changesets
+        self.repository = repository
+        self.vcs        = 'git'
+
+def vcs_connection(items):
+    conn = agicen_connection(items)
+    conn.fid_pattern = re.compile(r'((US|DE)\d+)', re.IGNORECASE)  # rather than query the TypeDefinition prefixes
+    conn.build_def['Jenkins'] = {'DonCamillo': MockBuild({'Name': 'DonCamillo', 'ObjectID': 11, 'ref': 'builddefinition/11'})}
+    return conn
+
+def test_prerequisites_create_the_repository_and_changesets():
+    conn = vcs_connection({'Artifact': [MockBuild({'FormattedID': 'US12', 'ObjectID': 812, 'ref': 'hierarchicalrequirement/812'})]})
+    camillo = VCSBuild([Changeset('a' * 40, 'US12 ring the bell'), Changeset('b' * 40, 'polish the bell')])
+    changesets, build_defn = conn.prepAgileCentralBuildPrerequisites(plan('DonCamillo'), camillo, 'Jenkins')
+
+    assert build_defn.ObjectID == 11
+    assert conn.agicen.creations == ['SCMRepository', 'Changeset', 'Changeset']
+    scm_repo = conn.agicen.created[0]
+    assert (scm_repo['Name'], scm_repo['SCMType']) == ('brescello/camillo', 'git')
+    assert [cs.Revision for cs in changesets] == ['a' * 40, 'b' * 40]
+    assert changesets[0].SCMRepository == 'scmrepository/501'
+    assert changesets[0].Artifacts == ['hierarchicalrequirement/812']
+    assert changesets[1].Artifacts == []
+
+def test_prerequisites_reuse_the_repository_of_a_recorded_changeset():
+    repository = MockBuild({'Name': 'brescello/camillo', 'ObjectID': 77, 'ref': 'scmrepository/77'})
+    recorded = MockBuild({'Revision': 'a' * 40, 'ObjectID': 700, 'oid': 700, 'SCMRepository': repository})
+    conn = vcs_connection({'Changeset': [recorded]})
+    camillo = VCSBuild([Changeset('a' * 40, 'ring the bell'), Changeset('b' * 40, 'polish the bell')])
+    changesets, build_defn = conn.prepAgileCentralBuildPrerequisites(plan('DonCamillo'), camillo, 'Jenkins')
+
+    assert conn.agicen.creations == ['Changeset']
+    assert conn.agicen.created[0]['SCMRepository'] == 'scmrepository/77'
+    assert changesets[0] is recorded
+    assert [cs.Revision for cs in changesets] == ['a' * 40, 'b' * 40]
+
+def test_prerequisites_skip_changes_without_a_repository():
+    conn = vcs_connection({})
+    changesets, build_defn = conn.prepAgileCentralBuildPrerequisites(plan('DonCamillo'),
+                                                                     VCSBuild([Changeset('a' * 40, 'US1')], repository=None), 'Jenkins')
+    assert changesets is None
+    assert build_defn.ObjectID == 11
+    assert conn.agicen.queries == [] and conn.agicen.created == []
+
+
+def artifact(fid, oid):
+    return MockBuild({'FormattedID': fid, 'ObjectID': oid, 'ref': 'hierarchicalrequirement/%d' % oid})
+
+def test_resolved_artifacts_are_taken_from_the_cache():
+    conn = agicen_connection({'Artifact': [artifact('US12', 812)]})
+    assert conn.resolveArtifacts(['US12'])['US12'].ref == 'hierarchicalrequirement/812'
+    assert conn.resolveArtifacts(['US12', 'US12'])['US12'].ObjectID == 812
+    assert len(conn.agicen.queries) == 1
+
+def test_expired_artifacts_are_looked_up_again():
+    conn = agicen_connection({'Artifact': [artifact('US12', 812)]})
+    conn.resolveArtifacts(['US12'])
+    oid, ref, resolved = conn.artifact_refs['US12']
+    conn.artifact_refs['US12'] = (oid, ref, resolved - bldeif.agicen_bld_connection.ARTIFACT_MEMORY_TTL - 1)
+    conn.agicen.items['Artifact'] = []  # US12 has since been deleted
+
+    assert conn.resolveArtifacts(['US12']) == {}
+    assert len(conn.agicen.queries) == 2
+    assert 'US12' not in conn.artifact_refs
+
+def test_artifact_cache_keeps_the_most_recently_used(monkeypatch):
+    monkeypatch.setattr(bldeif.agicen_bld_connection, 'ARTIFACT_CACHE_SIZE', 2)
+    conn = agicen_connection({})
+    for oid, fid in enumerate(['US1', 'US2', 'US1', 'US3']):
+        conn.agicen.items['Artifact'] = [artifact(fid, oid)]
+        conn.resolveArtifacts([fid])
+    assert list(conn.artifact_refs) == ['US1', 'US3']
+    assert len(conn.agicen.queries) == 3  # the second US1 came from the cache
+
+def test_artifact_cache_file_entries_expire(tmp_path):
+    cache_file = str(tmp_path / 'artifacts.cache')
+    conn = AgileCentralConnection(dict(CONFIG, ArtifactCacheTTL=10), logger)
+    conn.agicen = Rally({'Artifact': [artifact('US12', 812), artifact('US13', 813)]})
+    conn.useArtifactCache(cache_file, 'fp')
+    conn.resolveArtifacts(['US12', 'US13'])
+    oid, ref, resolved = conn.artifact_refs['US13']
+    conn.artifact_refs['US13'] = (oid, ref, resolved - 11 * 60)
+    conn._saveArtifactCache()
+
+    next_run = AgileCentralConnection(dict(CONFIG, ArtifactCacheTTL=10), logger)
+    next_run.agicen = Rally({'Artifact': [artifact('US13', 813)]})
+    next_run.useArtifactCache(cache_file, 'fp')
+    assert sorted(next_run.resolveArtifacts(['US12', 'US13'])) == ['US12', 'US13']
+    assert len(next_run.agicen.queries) == 1
+    assert 'US12' not in next_run.agicen.queries[0][1]
+
+
+class TypeDefinitions(Rally):
+    """
+        Answers the TypeDefinition queries with a Feature and an Initiative PI type plus the artifact types
+    """
+    prefixes = {'HierarchicalRequirement': 'US', 'Defect': 'DE', 'DefectSuite': 'DS', 'TestCase': 'TC', 'Task': 'TA'}
+
+    def get(self, entity, query=None, **kwargs):
+        self.queries.append((entity, query))
+        if kwargs.get('instance'):
+            name = re.search(r'ElementName = "(\w+)"', query).group(1)
+            return MockBuild({'ElementName': name, 'IDPrefix': self.prefixes[name]})
+        return WSAPIResponse([MockBuild({'ElementName': 'Feature', 'IDPrefix': 'F'}),
+                              MockBuild({'ElementName': 'Initiative', 'IDPrefix': 'I'})])
+
+def prefix_connection(cache_file=None, fingerprint='fp'):
+    conn = AgileCentralConnection(dict(CONFIG, PrefixCacheTTL=10), logger)
+    conn.agicen = TypeDefinitions({})
+    if cache_file:
+        conn.usePrefixCache(cache_file, fingerprint)
+    return conn
+
+def test_artifact_pattern_matches_the_type_prefixes():
+    conn = prefix_connection()
+    pattern = conn.artifactPattern()
+    assert [fid for fid, prefix in pattern.findall('US12 and f3 close I7, TA4 and DE5 but not X9')] == \
+           ['US12', 'f3', 'I7', 'TA4', 'DE5']
+    assert conn.artifactPattern() is pattern
+    assert len(conn.agicen.queries) == 6  # the PI types and one per artifact type, only the once
+
+def test_prefixes_are_taken_from_the_cache_file(tmp_path):
+    cache_file = str(tmp_path / 'prefixes.cache')
+    prefix_connection(cache_file).artifactPattern()
+
+    next_run = prefix_connection(cache_file)
+    assert next_run.artifactPattern().match('F3')
+    assert next_run.agicen.queries == []
+
+def test_prefixes_are_queried_again_when_the_cache_file_is_stale(tmp_path):
+    cache_file = str(tmp_path / 'prefixes.cache')
+    prefix_connection(cache_file).artifactPattern()
+
+    other_config = prefix_connection(cache_file, fingerprint='other')
+    other_config.artifactPattern()
+    assert len(other_config.agicen.queries) == 6
+
+    with open(cache_file) as f:
+        cached = json.load(f)
+    cached['written'] -= 11 * 60
+    with open(cache_file, 'w') as f:
+        json.dump(cached, f)
+    expired = prefix_connection(cache_file, fingerprint='other')  # as rewritten for other_config
+    assert expired.artifactPattern().match('US12')
+    assert len(expired.agicen.queries) == 6
+
+
+class Changesets(Rally):
+    """
+        Answers the Changeset queries with the recorded Changesets whose Revision the query mentions
+    """
+    def get(self, entity, query=None, **kwargs):
+        self.queries.append((entity, query))
+        return WSAPIResponse([cs for cs in self.items.get(entity, []) if '"%s"' % cs.Revision in query])
+
+def recorded_changeset(revision, repository):
+    return MockBuild({'Revision': revision, 'ObjectID': 700, 'oid': 700,
+                      'SCMRepository': MockBuild({'Name': repository, 'ref': 'scmrepository/77'})})
+
+def test_changesets_are_looked_up_a_chunk_of_revisions_at_a_time():
+    revisions = ['%040x' % ix for ix in range(120)]
+    conn = agicen_connection({})
+    conn.agicen = Changesets({'Changeset': [recorded_changeset(revision, 'brescello/camillo') for revision in revisions[::2]]})
+    changesets = conn.resolveChangesets(revisions)
+
+    assert sorted(changesets) == revisions[::2]
+    assert len(conn.agicen.queries) == 3
+    assert all(query.count('Revision = ') <= 50 for entity, query in conn.agicen.queries)
+
+def test_present_changesets_are_those_in_the_repository_of_the_first_found():
+    a, b, c, d = ['%040x' % ix for ix in range(1, 5)]
+    conn = agicen_connection({})
+    conn.agicen = Changesets({'Changeset': [recorded_changeset(b, 'brescello/camillo'),
+                                            recorded_changeset(c, 'brescello/peppone'),
+                                            recorded_changeset(d, 'brescello/camillo')]})
+    camillo = VCSBuild([Changeset(x, 'ring the bell') for x in (a, b, c, d, b)])
+    present, missing = conn.getCorrespondingChangesets(camillo)
+
+    assert [cs.Revision for cs in present] == [b, d]
+    assert [cs.commitId for cs in missing] == [a, c]
+    assert conn.agicen.creations == []
+
+def test_repository_is_ensured_when_no_changeset_is_found():
+    conn = agicen_connection({})
+    conn.agicen = Changesets({})
+    camillo = VCSBuild([Changeset('a' * 40, 'ring the bell')])
+    present, missing = conn.getCorrespondingChangesets(camillo)
+
+    assert (present, missing) == ([], camillo.changeSets)
+    assert conn.agicen.creations == ['SCMRepository']
+    assert conn.agicen.created[0]['Name'] == 'brescello/camillo'
@@ -0,0 +1,181 @@
+import json
+import calendar
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from bldeif.utils.klog          import ActivityLogger
+from bldeif.bamboo_connection   import BambooConnection, BambooBuild
+from bldeif.utils.eif_exception import OperationalError
+
+logger = ActivityLogger('logs/test_bamboo_results.log')
+
+CONFIG = {'Server': 'localhost', 'Port': 8085, 'Username': 'toto', 'Password': 'x', 'PageSize': 2,
+          'AgileCentral_DefaultBuildProject': 'Bamboo',
+          'Projects': [{'Project': 'Fernandel', 'AgileCentral_Project': 'Rally Fernandel', 'Plans': ['DonCamillo']}]}
+
+REF_TIME = calendar.timegm((2017, 6, 24, 0, 0, 0, 0, 0, 0))
+
+
+def result(number, completed):
+    return {'id': number, 'number': number, 'buildResultKey': 'FER-DON-%d' % number, 'key': 'FER-DON-%d' % number,
+            'finished': True, 'buildState': 'Successful', 'state': 'Successful',
+            'buildStartedTime': completed, 'buildCompletedTime': completed, 'buildDuration': 1000,
+            'projectName': 'Fernandel', 'planName': 'DonCamillo',
+            'plan': {'key': 'FER-DON', 'name': 'Fernandel - DonCamillo', 'shortName': 'DonCamillo',
+                     'link': {'href': 'http://localhost:8085/rest/api/latest/plan/FER-DON'}},
+            'link': {'href': 'http://localhost:8085/rest/api/latest/result/FER-DON-%d' % number}}
+
+class Response:
+    def __init__(self, document, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(document).encode('utf-8')
+    def json(self):
+        return json.loads(self.content)
+    def iter_content(self, chunk_size=1):
+        return [self.content[ix:ix + chunk_size] for ix in range(0, len(self.content), chunk_size)]
+    def close(self):
+        pass
+
+class Transport:
+    """
+        Serves the listed (ie, finished) results of a plan, most recent build number first, a page at a time
+    """
+    def __init__(self, results):
+        self.results = sorted(results, key=lambda record: record['number'], reverse=True)
+        self.requests = 0
+        self.pages    = []  # the (start-index, max-results) of each request
+    def get(self, url, stream=False):
+        self.requests += 1
+        query = parse_qs(urlparse(url).query)
+        start = int(query.get('start-index', ['0'])[0])
+        size  = int(query.get('max-results', ['25'])[0])
+        page  = self.results[start:start + size]
+        self.pages.append((start, size))
+        return Response({'results': {'size': len(self.results), 'start-index': start, 'result': page}})
+
+def bamboo_connection(results, watermark=0):
+    conn = BambooConnection(CONFIG, logger)
+    conn.skip_unchanged = False  # every scan walks the result pages
+    conn.transport = Transport(results)
+    conn.setWatermarks({'FER-DON': {'number': watermark, 'timestamp': 0}} if watermark else {})
+    return conn
+
+def test_watermark_stops_the_walk():
+    conn = bamboo_connection([result(n, '2017-06-25T10:%02d:00.000Z' % n) for n in range(1, 11)], watermark=6)
+    builds = conn.collectBuildsPerPlan('FER-DON', REF_TIME)
+    assert [build.number for build in builds] == [7, 8, 9, 10]
+    assert conn.transport.requests == 3
+    assert conn.settledNumber('FER-DON', 10) == 10
+
+def test_results_are_walked_a_page_at_a_time():
+    conn = bamboo_connection([result(n, '2017-06-25T10:%02d:00.000Z' % n) for n in range(1, 8)])
+    builds = conn.collectBuildsPerPlan('FER-DON', REF_TIME)
+    assert [build.number for build in builds] == [1, 2, 3, 4, 5, 6, 7]
+    assert conn.transport.pages == [(0, 2), (2, 2), (4, 2), (6, 2)]  # the last page holds only build 1
+
+def test_watermark_kept_below_unfinished_build():
+    # build 8 is still running while 9 and 10 have finished
+    listed = [result(n, '2017-06-25T10:%02d:00.000Z' % n) for n in (5, 6, 7, 9, 10)]
+    conn = bamboo_connection(listed, watermark=6)
+    builds = conn.collectBuildsPerPlan('FER-DON', REF_TIME)
+    assert [build.number for build in builds] == [7, 9, 10]
+    assert conn.settledNumber('FER-DON', 10) == 7
+    assert conn.settledNumber('FER-DON', 7) == 7
+
+    # once 8 finishes, the next scan (starting above the settled watermark) picks it up
+    conn = bamboo_connection(listed + [result(8, '2017-06-25T11:00:00.000Z')], watermark=7)
+    builds = conn.collectBuildsPerPlan('FER-DON', REF_TIME)
+    assert sorted(build.number for build in builds) == [8, 9, 10]
+    assert conn.settledNumber('FER-DON', 10) == 10
+
+def test_unfinished_build_noted_at_ref_time_stop():
+    # the walk ends at build 3 (completed before ref_time), 5 isn't listed yet
+    listed = [result(3, '2017-06-23T10:00:00.000Z')] + \
+             [result(n, '2017-06-25T10:%02d:00.000Z' % n) for n in (4, 6)]
+    conn = bamboo_connection(listed)
+    builds = conn.collectBuildsPerPlan('FER-DON', REF_TIME)
+    assert [build.number for build in builds] == [4, 6]
+    assert conn.settledNumber('FER-DON', 6) == 4
+
+def test_gone_plan_invalidates_inventory():
+    conn = bamboo_connection([])
+    conn.plans = ['stale plan']
+    conn.transport.get = lambda url, stream=False: type('Response', (), {'status_code': 404, 'close': lambda self: None})()
+    assert conn.collectBuildsPerPlan('FER-DON', REF_TIME) == []
+    assert conn.plans == []
+
+def test_probe_with_pending_results_above_watermark():
+    # the latest result completed before ref_time but is above the watermark, a build below it may have finished late
+    conn = bamboo_connection([result(n, '2017-06-23T10:%02d:00.000Z' % n) for n in range(1, 11)], watermark=7)
+    assert conn.planHasNewResults('FER-DON', REF_TIME)
+    conn.setWatermarks({'FER-DON': {'number': 10, 'timestamp': 0}})
+    assert not conn.planHasNewResults('FER-DON', REF_TIME)
+    conn.setWatermarks({})
+    assert not conn.planHasNewResults('FER-DON', REF_TIME)
+
+def test_skip_unchanged_plans_is_opt_in():
+    assert BambooConnection(CONFIG, logger).skip_unchanged is False
+    assert BambooConnection(dict(CONFIG, SkipUnchangedPlans=True), logger).skip_unchanged is True
+
+
+GIT_SHA = '3f786850e387550fdab836ed7e6dc881de23001b'
+
+def expanded_result(revisions, changes):
+    raw = result(7, '2017-06-25T10:07:00.000Z')
+    raw['vcsRevisions'] = {'size': len(revisions), 'vcsRevision': revisions}
+    raw['changes'] = {'size': len(changes), 'change': changes}
+    return raw
+
+def change(commit_id, comment, date='2017-06-25T09:30:00.000+02:00'):
+    return {'changesetId': commit_id, 'comment': comment, 'author': 'peppone', 'date': date,
+            'commitUrl': 'https://github.com/brescello/camillo/commit/%s' % commit_id}
+
+class ResultTransport:
+    """
+        Answers every request with the same document (and status code), counting the requests
+    """
+    def __init__(self, document, status_code=200):
+        self.response = Response(document, status_code)
+        self.urls = []
+    def get(self, url, stream=False):
+        self.urls.append(url)
+        return self.response
+
+def test_expand_vcs_data_of_a_git_build():
+    raw = expanded_result([{'repositoryName': 'brescello/camillo', 'vcsRevisionKey': GIT_SHA}],
+                          [change(GIT_SHA, 'US12 ring the bell'), change('9' * 40, 'DE3 fix the tower clock')])
+    conn = bamboo_connection([])
+    conn.transport = ResultTransport(raw)
+    build = conn.expandVCSData(BambooBuild(result(7, '2017-06-25T10:07:00.000Z')))
+
+    assert conn.transport.urls[0].endswith('/result/FER-DON-7.json?expand=changes.change,vcsRevisions')
+    assert (build.repository, build.vcs, build.vcs_expanded) == ('brescello/camillo', 'git', True)
+    assert [cs.commitId for cs in build.changeSets] == [GIT_SHA, '9' * 40]
+    assert build.changeSets[0].timestamp == calendar.timegm((2017, 6, 25, 7, 30, 0, 0, 0, 0)) * 1000
+    assert (build.changeSets[0].message, build.changeSets[0].vcs) == ('US12 ring the bell', 'git')
+
+    conn.expandVCSData(build)  # already expanded, no further request
+    assert len(conn.transport.urls) == 1
+
+def test_expand_vcs_data_of_a_non_git_build():
+    raw = expanded_result([{'repositoryName': 'camillo-svn', 'vcsRevisionKey': '1047'}], [change('1047', 'typo')])
+    conn = bamboo_connection([])
+    conn.transport = ResultTransport(raw)
+    build = conn.expandVCSData(BambooBuild(result(7, '2017-06-25T10:07:00.000Z')))
+    assert (build.repository, build.vcs) == ('camillo-svn', 'Bamboo')
+    assert [cs.vcs for cs in build.changeSets] == ['Bamboo']
+
+def test_changes_without_a_revision_are_left_out():
+    conn = bamboo_connection([])
+    conn.transport = ResultTransport(expanded_result([], [change(GIT_SHA, 'US12 ring the bell')]))
+    build = conn.expandVCSData(BambooBuild(result(7, '2017-06-25T10:07:00.000Z')))
+    assert (build.repository, build.changeSets, build.vcs_expanded) == (None, [], True)
+
+def test_expand_vcs_data_failure():
+    conn = bamboo_connection([])
+    conn.transport = ResultTransport({}, status_code=500)
+    build = BambooBuild(result(7, '2017-06-25T10:07:00.000Z'))
+    with pytest.raises(OperationalError):
+        conn.expandVCSData(build)
+    assert not build.vcs_expanded
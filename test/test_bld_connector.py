@@ -0,0 +1,203 @@
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from bldeif.utils.klog     import ActivityLogger
+from bldeif.utils.eif_exception import OperationalError
+from bldeif.utils.watermark_file import WatermarkFile
+from bldeif.bld_connector  import BLDConnector
+
+logger = ActivityLogger('logs/test_bld_connector.log')
+
+
+class Item:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+def plan(key, name):
+    return Item(key=key, name=name)
+
+def build(number, timestamp=0):
+    return Item(number=number, timestamp=timestamp, finished=True)
+
+def agicen_build(number):
+    return Item(Number=number)
+
+def bld_connector(**attributes):
+    """
+        A BLDConnector with just the attributes the exercised methods need, no config or connections
+    """
+    connector = BLDConnector.__new__(BLDConnector)
+    connector.log = logger
+    connector.__dict__.update(attributes)
+    return connector
+
+def test_partition_ignores_non_numeric_agicen_numbers():
+    connector = bld_connector()
+    don = plan('FER-DON', 'DonCamillo')
+    agicen_builds = {'Rally Fernandel': {'DonCamillo': [agicen_build('3'), agicen_build('1.2.3'), agicen_build(None)]}}
+    bld_builds    = {'Rally Fernandel': {don: [build(3), build(4)]}}
+    unrecorded, reflected = connector._partitionBuilds(agicen_builds, bld_builds)
+    assert [b.number for p, b, ac_project in reflected]  == [3]
+    assert [b.number for p, b, ac_project in unrecorded] == [4]
+
+
+class AgileCentral:
+    concurrency = 2
+
+class BuildSystem:
+    """
+        Hands out a single new build for each of the plans, in turn
+    """
+    def __init__(self, plans):
+        self.plans   = plans
+        self.fetched = []
+    def iterRecentBuilds(self, ref_time):
+        for plan in self.plans:
+            self.fetched.append(plan.key)
+            yield 'Rally Fernandel', plan, [build(1)]
+
+def pipelined_connector(plans, reflect):
+    def prepareDefinitions(unrecorded_builds, stalled_plans):
+        return {(ac_project, plan.name): plan.name for plan, build, ac_project in unrecorded_builds}, set()
+
+    def reflectDefinitionBuilds(builds, build_defns, existing_builds, preview_mode, final_builds, stalled_plans):
+        return {(plan.key, build.number): reflect(plan, build) for plan, build, ac_project in builds}
+
+    return bld_connector(agicen_conn=AgileCentral(), bld_conn=BuildSystem(plans),
+                         _prepareDefinitions=prepareDefinitions, _reflectDefinitionBuilds=reflectDefinitionBuilds)
+
+def test_pipelined_reflect_carries_on_past_a_failing_plan():
+    plans = [plan('FER-P%d' % ix, 'Plan %d' % ix) for ix in range(6)]
+    def reflect(plan, build):
+        if plan.key == 'FER-P2':
+            raise OperationalError("BuildDefinition locked")
+        return ('Build', 'posted')
+    connector = pipelined_connector(plans, reflect)
+
+    unrecorded, outcomes = connector._reflectPipelined({}, 0, False)
+    assert len(unrecorded) == 6
+    assert sorted(key for key, number in outcomes) == ['FER-P0', 'FER-P1', 'FER-P3', 'FER-P4', 'FER-P5']
+
+class WorkerDied(BaseException):
+    pass
+
+def test_pipelined_reflect_stops_fetching_when_the_workers_die():
+    plans = [plan('FER-P%d' % ix, 'Plan %d' % ix) for ix in range(50)]
+    def reflect(plan, build):
+        raise WorkerDied()
+    connector = pipelined_connector(plans, reflect)
+
+    with pytest.raises(WorkerDied):
+        connector._reflectPipelined({}, 0, False)
+    assert len(connector.bld_conn.fetched) < len(plans)
+    assert not [thread for thread in threading.enumerate() if thread.name == 'plan-producer']
+
+
+class ScanningAgileCentral:
+    lookback = 3600
+    def __init__(self, builds, barrier=None):
+        self.builds   = builds
+        self.barrier  = barrier
+        self.connects = 0
+        self.scans    = 0
+    def connect(self):
+        self.connects += 1
+    def validateProjects(self, projects):
+        return True
+    def getRecentBuilds(self, ref_time, projects):
+        if self.barrier:
+            self.barrier.wait()
+        self.scans += 1
+        return self.builds
+
+class ScanningBuildSystem:
+    lookback = 3600
+    def __init__(self, builds, barrier=None):
+        self.builds  = builds
+        self.barrier = barrier
+    def getRecentBuilds(self, ref_time):
+        if self.barrier:
+            self.barrier.wait()
+        return self.builds
+
+def reflecting_connector(tmp_path, agicen_conn, bld_conn, **attributes):
+    """
+        A connector in Preview mode whose _reflectUnrecordedBuilds keeps the builds it is given in reflected
+    """
+    reflected = []
+    def reflectUnrecordedBuilds(unrecorded_builds, preview_mode):
+        reflected.extend(unrecorded_builds)
+        return {}
+    settings = dict(agicen_conn=agicen_conn, bld_conn=bld_conn, bld_name='Bamboo', svc_conf={'Preview': True},
+                    watermark_file=WatermarkFile(str(tmp_path / 'watermarks'), logger),
+                    target_projects=['Rally Fernandel'], max_builds=20, pipeline=False, concurrent_scans=False,
+                    agicen_connected=True, startup_timings=OrderedDict(), reflected=reflected,
+                    _reflectUnrecordedBuilds=reflectUnrecordedBuilds)
+    settings.update(attributes)
+    return bld_connector(**settings)
+
+def test_concurrent_scans_are_merged(tmp_path):
+    both_scanning = threading.Barrier(2, timeout=5)  # neither scan gets past it unless the other runs alongside
+    don = plan('FER-DON', 'DonCamillo')
+    agicen_conn = ScanningAgileCentral({'Rally Fernandel': {'DonCamillo': [agicen_build('1'), agicen_build('2')]}},
+                                       both_scanning)
+    bld_conn = ScanningBuildSystem({'Rally Fernandel': {don: [build(3, 30), build(1, 10), build(2, 20)]}}, both_scanning)
+    connector = reflecting_connector(tmp_path, agicen_conn, bld_conn, concurrent_scans=True)
+
+    connector.reflectBuildsInAgileCentral(1498262400)
+    assert [(p.key, b.number) for p, b, ac_project in connector.reflected] == [('FER-DON', 3)]
+
+def test_concurrent_scan_failure_is_raised(tmp_path):
+    class FailingBuildSystem(ScanningBuildSystem):
+        def getRecentBuilds(self, ref_time):
+            raise OperationalError("Bamboo is down")
+    agicen_conn = ScanningAgileCentral({})
+    connector = reflecting_connector(tmp_path, agicen_conn, FailingBuildSystem({}), concurrent_scans=True)
+
+    with pytest.raises(OperationalError):
+        connector.reflectBuildsInAgileCentral(1498262400)
+    assert agicen_conn.scans == 1
+
+def test_lazy_connect_skips_agile_central_without_recent_builds(tmp_path):
+    don = plan('FER-DON', 'DonCamillo')
+    agicen_conn = ScanningAgileCentral({})
+    connector = reflecting_connector(tmp_path, agicen_conn, ScanningBuildSystem({'Rally Fernandel': {don: []}}),
+                                     agicen_connected=False)
+
+    status, recorded = connector.reflectBuildsInAgileCentral(1498262400)
+    assert (status, recorded) == (False, OrderedDict())
+    assert (agicen_conn.connects, agicen_conn.scans) == (0, 0)
+    assert not connector.agicen_connected
+
+def test_lazy_connect_connects_once_there_are_builds(tmp_path):
+    don = plan('FER-DON', 'DonCamillo')
+    agicen_conn = ScanningAgileCentral({'Rally Fernandel': {'DonCamillo': [agicen_build('1')]}})
+    bld_conn = ScanningBuildSystem({'Rally Fernandel': {don: [build(1, 10), build(2, 20)]}})
+    connector = reflecting_connector(tmp_path, agicen_conn, bld_conn, agicen_connected=False)
+
+    connector.reflectBuildsInAgileCentral(1498262400)
+    connector.reflectBuildsInAgileCentral(1498262400)
+    assert (agicen_conn.connects, agicen_conn.scans) == (1, 2)
+    assert [b.number for p, b, ac_project in connector.reflected] == [2, 2]
+
+def test_lazy_connect_failure_is_raised_before_any_project_lookup(tmp_path):
+    class Unreachable(ScanningAgileCentral):
+        def connect(self):
+            self.connects += 1
+            raise OperationalError("Unable to connect to Agile Central")
+        def validateProjects(self, projects):
+            raise AssertionError("projects looked up without a connection")
+    don = plan('FER-DON', 'DonCamillo')
+    agicen_conn = Unreachable({})
+    bld_conn = ScanningBuildSystem({'Rally Fernandel': {don: [build(1, 10)]}})
+    connector = reflecting_connector(tmp_path, agicen_conn, bld_conn, agicen_connected=False)
+
+    for attempt in range(2):
+        with pytest.raises(OperationalError, match="Unable to connect"):
+            connector.reflectBuildsInAgileCentral(1498262400)
+    assert (agicen_conn.connects, agicen_conn.scans) == (2, 0)  # each run tries again
+    assert not connector.agicen_connected
+    assert connector.reflected == []
+    assert 'Agile Central projects' not in connector.startup_timings
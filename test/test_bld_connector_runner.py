@@ -0,0 +1,117 @@
+import os
+import signal
+
+import pytest
+
+import bldeif.bld_connector_runner
+from bldeif.bld_connector_runner import BuildConnectorRunner
+from bldeif.utils.eif_exception  import ConfigurationError, OperationalError
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the runner writes its log files to the logs subdir of the current directory
+
+class Connection:
+    def __init__(self):
+        self.disconnected = False
+    def disconnect(self):
+        self.disconnected = True
+
+class Connector:
+    def __init__(self):
+        self.agicen_conn = Connection()
+        self.bld_conn    = Connection()
+
+def daemon_runner(*options, polls=3, service=None):
+    """
+        A --daemon runner whose polls are serviced by service(runner, config_file) instead of a BLDConnector
+        and which stops after polls polls, the delays it would have slept are kept in runner.delays
+    """
+    runner = BuildConnectorRunner(['camillo.yml', 'cannoli.yml', '--daemon'] + list(options))
+    runner.serviced = []
+    runner.delays   = []
+
+    def serviceConfig(config_file):
+        runner.serviced.append(config_file)
+        if service:
+            service(runner, config_file)
+
+    def sleep(delay):
+        runner.delays.append(delay)
+        if len(runner.delays) >= polls:
+            runner.stop_requested.set()
+
+    runner._serviceConfig = serviceConfig
+    runner.sleep = sleep
+    return runner
+
+def test_interval_and_jitter_options():
+    runner = BuildConnectorRunner(['camillo.yml', '--daemon', '--interval=120'])
+    assert (runner.daemon, runner.interval, runner.jitter) == (True, 120, 12)
+    runner = BuildConnectorRunner(['camillo.yml', '--interval=60', '--jitter=0'])
+    assert (runner.daemon, runner.interval, runner.jitter) == (False, 60, 0)
+    with pytest.raises(ConfigurationError):
+        BuildConnectorRunner(['camillo.yml', '--interval=soon'])
+
+def test_poll_delay_stays_within_the_jitter():
+    runner = BuildConnectorRunner(['camillo.yml', '--daemon', '--interval=60', '--jitter=6'])
+    delays = [runner.pollDelay() for i in range(500)]
+    assert all(54 <= delay <= 66 for delay in delays)
+    assert len(set(delays)) > 1
+    runner = BuildConnectorRunner(['camillo.yml', '--daemon', '--interval=5', '--jitter=30'])
+    assert all(runner.pollDelay() >= 0 for i in range(100))
+
+def test_daemon_polls_every_config_until_stopped():
+    runner = daemon_runner('--interval=60', '--jitter=6', polls=3)
+    runner.runDaemon()
+    assert runner.serviced == ['camillo.yml', 'cannoli.yml'] * 3
+    assert len(runner.delays) == 3
+    assert all(54 <= delay <= 66 for delay in runner.delays)
+
+def test_failed_poll_disconnects_its_connector():
+    connectors = []
+    def service(runner, config_file):
+        if config_file != 'camillo.yml':
+            return
+        connectors.append(Connector())
+        runner.connectors[config_file] = (0, connectors[-1], False)
+        if len(connectors) == 1:
+            raise OperationalError("Bamboo went away")
+
+    runner = daemon_runner(polls=2, service=service)
+    runner.runDaemon()
+    first, second = connectors
+    assert first.agicen_conn.disconnected and first.bld_conn.disconnected
+    assert second.agicen_conn.disconnected and second.bld_conn.disconnected  # on the way out
+    assert runner.connectors == {}
+
+def test_sigterm_stops_the_daemon_after_the_current_poll():
+    def service(runner, config_file):
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    runner = daemon_runner(service=service)
+    runner.runDaemon()
+    assert runner.serviced == ['camillo.yml']
+    assert runner.delays == []
+    assert signal.getsignal(signal.SIGTERM) is previous_handler
+
+def test_modified_config_disconnects_the_old_connector(monkeypatch):
+    os.makedirs('configs')
+    config_path = os.path.join('configs', 'camillo.yml')
+    with open(config_path, 'w') as config_file:
+        config_file.write("BambooBuildConnector:\n")
+    monkeypatch.setattr(bldeif.bld_connector_runner, 'BLDConnector', lambda config, log: Connector())
+    runner = BuildConnectorRunner(['camillo.yml', '--daemon'])
+    runner.getConfiguration = lambda config_name: {}
+
+    first = runner.obtainConnector('camillo.yml', config_path)
+    assert runner.obtainConnector('camillo.yml', config_path) is first
+    os.utime(config_path, (os.path.getmtime(config_path) + 60,) * 2)
+    second = runner.obtainConnector('camillo.yml', config_path)
+
+    assert second is not first
+    assert first.agicen_conn.disconnected and first.bld_conn.disconnected
+    assert not second.agicen_conn.disconnected
+    assert runner.connectors['camillo.yml'][1] is second
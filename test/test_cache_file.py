@@ -0,0 +1,40 @@
+import time
+
+from bldeif.utils.klog       import ActivityLogger
+from bldeif.utils.cache_file import CacheFile
+
+logger = ActivityLogger('logs/test_cache_file.log')
+
+INVENTORY = {'Fernandel': {'AgileCentral_Project': 'Rally Fernandel',
+                           'Plans': [{'key': 'FER-DON', 'name': 'Fernandel - DonCamillo', 'shortName': 'DonCamillo',
+                                      'link': {'href': 'http://localhost:8085/rest/api/latest/plan/FER-DON'}}]}}
+
+
+def test_empty_cache(tmp_path):
+    cache = CacheFile(str(tmp_path / 'plans.cache'), logger, ttl=60)
+    assert not cache.exists()
+    assert cache.read() is None
+
+def test_round_trip(tmp_path):
+    cache = CacheFile(str(tmp_path / 'plans.cache'), logger, ttl=60)
+    cache.write(INVENTORY, 'camillo.yml:1498623705')
+    assert cache.read('camillo.yml:1498623705') == INVENTORY
+
+def test_fingerprint_mismatch(tmp_path):
+    cache = CacheFile(str(tmp_path / 'plans.cache'), logger, ttl=60)
+    cache.write(INVENTORY, 'camillo.yml:1498623705')
+    assert cache.read('camillo.yml:1498627777') is None
+
+def test_expiration(tmp_path):
+    cache = CacheFile(str(tmp_path / 'plans.cache'), logger, ttl=1)
+    cache.write(INVENTORY)
+    assert cache.read() == INVENTORY
+    time.sleep(2.1)
+    assert cache.read() is None
+
+def test_invalidate(tmp_path):
+    cache = CacheFile(str(tmp_path / 'plans.cache'), logger)
+    cache.write(INVENTORY)
+    cache.invalidate()
+    assert not cache.exists()
+    assert cache.read() is None
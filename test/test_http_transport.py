@@ -0,0 +1,43 @@
+from bldeif.utils.klog           import ActivityLogger
+from bldeif.utils.http_transport import HTTPTransport, RETRY_STATUS_CODES
+from bldeif.bamboo_connection    import BambooConnection
+
+logger = ActivityLogger('logs/test_http_transport.log')
+
+CONFIG = {'Server': 'localhost', 'Port': 8085, 'Username': 'toto', 'Password': 'x',
+          'ConnectTimeout': 5, 'ReadTimeout': 30, 'Retries': 4, 'RetryBackoff': 2, 'PoolSize': 16,
+          'AgileCentral_DefaultBuildProject': 'Bamboo',
+          'Projects': [{'Project': 'Fernandel', 'AgileCentral_Project': 'Rally Fernandel', 'Plans': ['DonCamillo']}]}
+
+
+class Response:
+    status_code = 200
+
+def test_adapter_retries_with_backoff():
+    transport = HTTPTransport(logger, pool_size=16, retries=4, backoff=2)
+    for url in ('http://localhost:8085', 'https://bamboo.example.com'):
+        adapter = transport.session.get_adapter(url)
+        retry = adapter.max_retries
+        assert (retry.total, retry.connect, retry.read, retry.status) == (4, 4, 4, 4)
+        assert retry.backoff_factor == 2
+        assert set(retry.status_forcelist) == set(RETRY_STATUS_CODES)
+        assert retry.raise_on_status is False
+        assert adapter._pool_maxsize == 16
+
+def test_requests_time_out_unless_told_otherwise():
+    transport = HTTPTransport(logger, connect_timeout=5, read_timeout=30)
+    sent = []
+    transport.session.get = lambda url, **kwargs: sent.append(kwargs) or Response()
+    transport.get('http://localhost:8085/rest/api/latest/info.json')
+    transport.get('http://localhost:8085/rest/api/latest/result/FER-DON', timeout=300, stream=True)
+    assert sent == [{'timeout': (5, 30)}, {'timeout': 300, 'stream': True}]
+    assert transport.request_count == 2
+
+def test_bamboo_connection_configures_its_transport():
+    conn = BambooConnection(CONFIG, logger)
+    conn._getBambooVersion = lambda: '6.0.3'
+    conn.connect()
+    assert conn.transport.timeout == (5, 30)
+    retry = conn.transport.session.get_adapter('http://localhost:8085').max_retries
+    assert (retry.total, retry.backoff_factor) == (4, 2)
+    conn.transport.close()
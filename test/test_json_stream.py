@@ -0,0 +1,48 @@
+import json
+import pytest
+
+from bldeif.utils.json_stream import iterJSONArray, JSONStreamError
+
+RESULTS = {'expand': 'results',
+           'link': {'href': 'http://localhost:8085/rest/api/latest/result/FER-DON', 'rel': 'self'},
+           'results': {'size': 3, 'expand': 'result', 'start-index': 0, 'max-result': 3,
+                       'result': [{'number': 74, 'buildResultKey': 'FER-DON-74', 'buildDuration': 123456789},
+                                  {'number': 73, 'buildResultKey': 'FER-DON-73', 'planName': 'áâèüSørençñ'},
+                                  {'number': 72, 'buildResultKey': 'FER-DON-72', 'finished': True}]}}
+
+
+def chunked(document, size):
+    content = json.dumps(document, ensure_ascii=False, indent=2).encode('utf-8')
+    return [content[ix:ix + size] for ix in range(0, len(content), size)]
+
+def test_whole_document():
+    records = list(iterJSONArray(chunked(RESULTS, 1000000), ('results', 'result')))
+    assert records == RESULTS['results']['result']
+
+def test_tiny_chunks():
+    # single byte chunks split numbers, keys and multi-byte characters
+    records = list(iterJSONArray(chunked(RESULTS, 1), ('results', 'result')))
+    assert records == RESULTS['results']['result']
+    assert records[0]['buildDuration'] == 123456789
+    assert records[1]['planName'] == 'áâèüSørençñ'
+
+def test_early_termination_reads_no_further():
+    chunks = chunked(RESULTS, 16)
+    consumed = []
+    def feed():
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+    records = iterJSONArray(feed(), ('results', 'result'))
+    assert next(records)['number'] == 74
+    assert len(consumed) < len(chunks)
+
+def test_empty_array_and_missing_path():
+    empty = {'results': {'size': 0, 'result': []}}
+    assert list(iterJSONArray(chunked(empty, 5), ('results', 'result'))) == []
+    assert list(iterJSONArray(chunked(empty, 5), ('projects', 'project'))) == []
+
+def test_truncated_content():
+    chunks = chunked(RESULTS, 50)[:-3]
+    with pytest.raises(JSONStreamError):
+        list(iterJSONArray(chunks, ('results', 'result')))
@@ -205,6 +205,29 @@ def test_identify_unrecorded_builds():
      assert len(unrecorded) == 1
 
 
+def test_recorded_builds():
+     config_file = "camillo.yml"
+     bamboo_helper = BambooTestHelper(config_file)
+     project_key = 'FER'
+     plan_key = 'RET'
+     plan_name = 'ReturnOfDonComillio'
+     new_build = bamboo_helper.build(project_key, plan_key)
+     time.sleep(1)
+
+     runner = BuildConnectorRunner([config_file])
+     runner.run()
+
+     ac_connection = runner.connector.agicen_conn
+     build_defn = ac_connection.build_def['Rally Fernandel'][plan_name]
+     build_number = int(new_build['buildNumber'])
+     # no recent Builds to go by, both candidates are looked up
+     ac_connection.recent_build_keys   = set()
+     ac_connection.recent_builds_since = None
+     candidates = [(build_defn, build_number, 0), (build_defn, build_number + 1000, 0)]
+     recorded = ac_connection.recordedBuilds(candidates)
+     assert recorded == set([ac_connection.buildKey(build_defn, build_number)])
+
+
 def test_special_chars():
     config_file = "foreigners.yml"
     bamboo_helper = BambooTestHelper(config_file)
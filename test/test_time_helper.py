@@ -31,6 +31,7 @@ def test_structFromSeconds():
         assert daylight != 1
 
 def test_stardard_vs_daylight_saving_time():
+    # Zulu strings are UTC no matter what the local time zone and DST setting is
     iso_str_feb    = "2017-02-01T12:00:00Z"
     secs_feb       = helper.secondsFromString(iso_str_feb)
     utc_struct_feb = helper.structFromSeconds(secs_feb)
@@ -39,7 +40,13 @@ def test_stardard_vs_daylight_saving_time():
     secs_may       = helper.secondsFromString(iso_str_may)
     utc_struct_may = helper.structFromSeconds(secs_may)
 
-    assert utc_struct_feb.tm_hour - utc_struct_may.tm_hour == 1
+    assert utc_struct_feb.tm_hour == utc_struct_may.tm_hour == 12
+
+    # Bamboo strings carry the offset in effect (MST in February, MDT in May)
+    secs_feb_mst = helper.secondsFromString("2017-02-01T05:00:00.000-07:00")
+    secs_may_mdt = helper.secondsFromString("2017-05-01T06:00:00.000-06:00")
+    assert secs_feb_mst == secs_feb
+    assert secs_may_mdt == secs_may
 
 
 def test_secondsFromStruct():
@@ -96,3 +103,29 @@ def test_pop_offset_colon():
     str1 = helper.popLastColon(bamboo_str)
     assert str1 == '2017-06-12T13:55:39.712-0600'
 
+def test_bamboo_timestamps():
+    bamboo_str = '2017-06-12T13:55:39.712-06:00'
+    secs = helper.secondsFromString(bamboo_str)
+    assert secs == 1497297339
+    assert helper.stringFromSeconds(secs, '%Y-%m-%dT%H:%M:%SZ') == '2017-06-12T19:55:39Z'
+    assert helper.secondsFromString('2017-06-12T21:55:39.712+02:00') == secs
+    assert helper.secondsFromString('2017-06-12 19:55:39 Z') == secs
+
+def test_fast_path_agrees_with_strptime():
+    samples = ['2017-06-12T13:55:39.712-06:00', '2017-06-26T12:26:08Z', '2017-06-26T12:26:08.222Z',
+               '2016-02-29T23:59:59.999+05:30', '2017-12-31T18:00:00.000-06:00']
+    for time_str in samples:
+        assert helper.secondsFromString(time_str) == helper.strptimeSecondsFromString(time_str)
+
+def test_secondsFromStrings():
+    samples = ['2017-06-12T13:55:39.712-06:00', '2017-06-26T12:26:08Z', '2017-06-12T13:55:39.712-06:00']
+    assert helper.secondsFromStrings(samples) == [helper.secondsFromString(s) for s in samples]
+    assert helper.secondsFromStrings([]) == []
+
+def test_fast_and_memoized_paths_agree_in_bulk():
+    base = 1497297339
+    samples = [time.strftime('%Y-%m-%dT%H:%M:%S.123-06:00', time.gmtime(base + ix * 61)) for ix in range(2000)]
+    slow     = [helper.strptimeSecondsFromString(time_str) for time_str in samples]
+    fast     = helper.secondsFromStrings(samples)
+    memoized = helper.secondsFromStrings(samples)
+    assert fast == slow == memoized
@@ -31,6 +31,30 @@ def test_bldconn_projects():
     recent_bld_builds = bld_connection.getRecentBuilds(ref_time)
     assert len(recent_bld_builds)
 
+def test_paged_plan_results():
+    konf = Konfabulator('cannoli.yml', logger, True)
+    bld_connector  = BLDConnector(konf, logger)
+    bld_connection = bld_connector.bld_conn
+    bld_connection.page_size = 2
+    last_run = '2017-06-24 00:00:00 Z'
+    ref_time = time_helper.secondsFromStruct(time_helper.parseTimeStringToStruct(last_run))
+    builds = bld_connection.collectBuildsPerPlan('FER-DON', ref_time)
+    assert len(builds) > 2
+    assert all(build.timestamp >= ref_time for build in builds)
+    numbers = [build.number for build in builds]
+    assert numbers == sorted(numbers)
+
+def test_configured_plan_discovery():
+    konf = Konfabulator('cannoli.yml', logger, True)
+    bld_connector  = BLDConnector(konf, logger)
+    bld_connection = bld_connector.bld_conn
+    bld_connection.plan_discovery = 'Configured'
+    plans = bld_connection.discoverPlans()
+    plan_names = [plan.name for plan in plans]
+    assert 'DonCamillo' in plan_names
+    assert set(plan_names) <= set(['DonCamillo', 'Ludovic Cruchot'])
+    assert bld_connection.discoverPlans() is plans
+
 
 
 # def test_default_config_spoke_validation():
@@ -0,0 +1,43 @@
+import os
+
+from bldeif.utils.klog           import ActivityLogger
+from bldeif.utils.watermark_file import WatermarkFile
+
+logger = ActivityLogger('logs/test_watermark_file.log')
+
+
+def test_no_file_means_no_watermarks(tmp_path):
+    watermark_file = str(tmp_path / 'watermark.file')
+    wmf = WatermarkFile(watermark_file, logger)
+    assert not wmf.exists()
+    assert wmf.read() == {}
+    assert wmf.get('FER-DON') == 0
+
+def test_round_trip(tmp_path):
+    watermark_file = str(tmp_path / 'watermark.file')
+    wmf = WatermarkFile(watermark_file, logger)
+    wmf.record('FER-DON', 74, 1497297339)
+    wmf.record('FER-RET', 12, 1497297400)
+    wmf.write()
+    assert os.listdir(str(tmp_path)) == ['watermark.file']  # no temp file left behind
+
+    again = WatermarkFile(watermark_file, logger)
+    marks = again.read()
+    assert marks['FER-DON'] == {'number': 74, 'timestamp': 1497297339}
+    assert again.get('FER-RET') == 12
+
+def test_watermark_never_lowered(tmp_path):
+    watermark_file = str(tmp_path / 'watermark.file')
+    wmf = WatermarkFile(watermark_file, logger)
+    wmf.record('FER-DON', 74, 1497297339)
+    wmf.record('FER-DON', 70, 1497290000)
+    assert wmf.get('FER-DON') == 74
+    wmf.record('FER-DON', 75, 1497297500)
+    assert wmf.watermarks['FER-DON']['timestamp'] == 1497297500
+
+def test_garbled_file_is_ignored(tmp_path):
+    watermark_file = str(tmp_path / 'watermark.file')
+    wmf = WatermarkFile(watermark_file, logger)
+    with open(watermark_file, 'w') as f:
+        f.write('{"FER-DON": {"numb')
+    assert wmf.read() == {}
@@ -0,0 +1,59 @@
+from bldeif.utils.wsapi_query import condition, parenthesized, orQuery, andQuery, chunkValues, orQueries
+
+
+def nesting_depth(query):
+    depth = deepest = 0
+    for char in query:
+        if char == '(':
+            depth += 1
+            deepest = max(deepest, depth)
+        elif char == ')':
+            depth -= 1
+    assert depth == 0
+    return deepest
+
+def test_single_value():
+    assert orQuery('Name', ['Bamboo']) == '(Name = "Bamboo")'
+    assert orQuery('Name', []) is None
+
+def test_unquoted_values():
+    assert condition('Project.ObjectID', 1234, quoted=False) == '(Project.ObjectID = 1234)'
+
+def test_balanced_or():
+    assert orQuery('Name', ['A', 'B', 'C']) == '((Name = "A") OR ((Name = "B") OR (Name = "C")))'
+    query = orQuery('Number', range(1024), quoted=False)
+    assert query.count(' OR ') == 1023
+    assert nesting_depth(query) == 11
+
+def test_and_query():
+    or_query = orQuery('Number', [1, 2], quoted=False)
+    assert andQuery('BuildDefinition.ObjectID = 5', or_query) == \
+           '((BuildDefinition.ObjectID = 5) AND ((Number = 1) OR (Number = 2)))'
+    assert andQuery(None, '(Name = "X")') == '(Name = "X")'
+
+def test_parenthesized():
+    assert parenthesized('Number = 3') == '(Number = 3)'
+    assert parenthesized('(Name = "X")') == '(Name = "X")'
+    assert parenthesized('(Name = "A") OR (Name = "B")') == '((Name = "A") OR (Name = "B"))'
+    assert parenthesized('(Name = "a)b")') == '(Name = "a)b")'
+    assert andQuery('(State = "Open") OR (State = "Closed")', '(Number = 1)') == \
+           '(((State = "Open") OR (State = "Closed")) AND (Number = 1))'
+
+def test_chunk_by_terms():
+    chunks = chunkValues('Number', range(120), quoted=False, max_terms=50)
+    assert [len(chunk) for chunk in chunks] == [50, 50, 20]
+    assert sorted(value for chunk in chunks for value in chunk) == list(range(120))
+
+def test_chunk_by_length():
+    names = ['Project with a rather long name number %03d' % ix for ix in range(40)]
+    chunks = chunkValues('Name', names, max_length=500)
+    assert len(chunks) > 1
+    assert all(len(orQuery('Name', chunk)) <= 500 for chunk in chunks)
+
+def test_chunk_duplicates():
+    assert chunkValues('FormattedID', ['US1', 'US1', 'DE2']) == [['DE2', 'US1']]
+
+def test_or_queries():
+    queries = orQueries('Revision', ['a%02d' % ix for ix in range(60)], criteria='SCMRepository.Name = "camillo"')
+    assert len(queries) == 2
+    assert all(query.startswith('((SCMRepository.Name = "camillo") AND (') for query in queries)